@@ -0,0 +1,86 @@
+"""
+Kod bo‘yicha qidiruv: eski yo‘l (har so‘rovda movies.json ni o‘qish)
+va xotiradagi katalog (get_item) solishtiriladi.
+
+    python benchmarks/catalog_lookup.py [titles] [lookups]
+"""
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+TMP = tempfile.mkdtemp(prefix="kino_bench_")
+os.environ["MOVIES_FILE"] = os.path.join(TMP, "movies.json")
+os.environ.setdefault("BOT_TOKEN", "123456:BENCHMARKBENCHMARKBENCHMARKBENCHMA")
+
+import bot  # noqa: E402
+
+
+def make_catalog(n: int) -> dict:
+    rnd = random.Random(42)
+    db = {}
+    for i in range(n):
+        code = str(1000 + i)
+        if i % 10 == 0:
+            db[code] = {
+                "type": "series",
+                "poster_file_id": f"AgACAgIAAxkBAAI{i:012d}",
+                "poster_caption": f"📺 Serial #{i}\n" + "Tavsif " * 40,
+                "episodes": {
+                    str(e): {"video_file_id": f"BAACAgIAAx{i:08d}{e:04d}", "video_unique_id": f"AgAD{i:08d}{e:04d}", "title": ""}
+                    for e in range(1, rnd.randint(2, 12))
+                },
+                "channel_msg_id": None,
+            }
+        elif i % 25 == 1:
+            # eski format (type yo‘q)
+            db[code] = {
+                "post_file_id": f"AgACAgIAAxkBAAI{i:012d}",
+                "post_caption": f"🎬 Фильм #{i}\n" + "Описание " * 40,
+                "video_file_id": f"BAACAgIAAx{i:012d}",
+                "video_unique_id": f"AgAD{i:012d}",
+            }
+        else:
+            db[code] = {
+                "type": "movie",
+                "post_file_id": f"AgACAgIAAxkBAAI{i:012d}",
+                "post_caption": f"🎬 Kino #{i}\n" + "Tavsif " * 40,
+                "video_file_id": f"BAACAgIAAx{i:012d}",
+                "video_unique_id": f"AgAD{i:012d}",
+                "channel_msg_id": i,
+            }
+    return db
+
+
+def bench(label: str, fn, codes) -> float:
+    t0 = time.perf_counter()
+    for c in codes:
+        fn(c)
+    dt = (time.perf_counter() - t0) / len(codes)
+    print(f"{label:<28} {dt * 1e6:12.1f} µs/lookup")
+    return dt
+
+
+def main() -> None:
+    titles = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    lookups = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    with open(os.environ["MOVIES_FILE"], "w", encoding="utf-8") as f:
+        json.dump(make_catalog(titles), f, ensure_ascii=False, indent=2)
+
+    size_mb = os.path.getsize(os.environ["MOVIES_FILE"]) / 1e6
+    print(f"katalog: {titles} ta, {size_mb:.1f} MB")
+    codes = [str(1000 + random.randrange(titles)) for _ in range(lookups)]
+
+    old = bench("load_db() har so‘rovda", lambda c: bot._read_db_file().get(c), codes)
+    bot.load_db()  # isitish
+    new = bench("get_item() (xotira)", bot.get_item, codes * 1000)
+    print(f"tezlanish: x{old / new:,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Katalog xotirasi: odatiy dict-of-dicts va CATALOG_COMPACT=true (__slots__ + mmap captionlar).
+Har bir rejim alohida jarayonda o‘lchanadi: RSS o‘sishi, Python heap (tracemalloc),
+load_db() vaqti va get_item + caption o‘qish vaqti.
+
+    python benchmarks/catalog_memory.py [titles] [--huge-series 10000]
+"""
+import argparse
+import gc
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+
+
+def rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3     # Linux emas: maksimum
+
+
+def child(trace: bool) -> None:
+    sys.path.insert(0, ROOT)
+    import bot
+
+    gc.collect()
+    if trace:
+        import tracemalloc
+        tracemalloc.start()
+    before = rss_mb()
+    t0 = time.perf_counter()
+    db = bot.load_db()
+    load_s = time.perf_counter() - t0
+    gc.collect()
+    out = {"rss_mb": rss_mb() - before, "load_s": load_s, "items": len(db)}
+    if trace:
+        out["heap_mb"] = tracemalloc.get_traced_memory()[0] / 1e6
+        tracemalloc.stop()
+
+    codes = random.Random(1).choices(list(db), k=100_000)
+    t0 = time.perf_counter()
+    for c in codes:
+        item = bot.get_item(c)
+        item.get("post_caption") or item.get("poster_caption")
+    out["get_caption_us"] = (time.perf_counter() - t0) / len(codes) * 1e6
+    if bot._captions is not None:
+        out["caption_store_mb"] = bot._captions.size / 1e6
+    print(json.dumps(out))
+
+
+def run(mode: bool, trace: bool, env: dict) -> dict:
+    env = dict(env, CATALOG_COMPACT="true" if mode else "false")
+    args = [sys.executable, __file__, "--child"] + (["--trace"] if trace else [])
+    res = subprocess.run(args, env=env, capture_output=True, text=True, check=True)
+    return json.loads(res.stdout.strip().splitlines()[-1])
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("titles", nargs="?", type=int, default=100_000)
+    ap.add_argument("--huge-series", type=int, default=0)
+    ap.add_argument("--child", action="store_true")
+    ap.add_argument("--trace", action="store_true")
+    args = ap.parse_args()
+    if args.child:
+        return child(args.trace)
+
+    sys.path.insert(0, HERE)
+    import synth
+
+    tmp = tempfile.mkdtemp(prefix="kino_mem_")
+    env = dict(os.environ,
+               MOVIES_FILE=os.path.join(tmp, "movies.json"),
+               MOVIES_JOURNAL=os.path.join(tmp, "movies.journal.jsonl"),
+               BOT_TOKEN=os.environ.get("BOT_TOKEN", "123456:BENCHMARKBENCHMARKBENCHMARKBENCHMA"))
+    size = synth.write_json(env["MOVIES_FILE"], synth.make_catalog(args.titles, huge_series=args.huge_series))
+    print(f"katalog: {args.titles} ta, movies.json {size / 1e6:.1f} MB")
+
+    results = {}
+    for name, mode in (("dict", False), ("compact", True)):
+        r = run(mode, False, env)
+        r.update({k: v for k, v in run(mode, True, env).items() if k == "heap_mb"})
+        results[name] = r
+        print(f"{name:<8} RSS +{r['rss_mb']:7.1f} MB  heap {r['heap_mb']:7.1f} MB  "
+              f"load_db {r['load_s']:.2f}s  get_item+caption {r['get_caption_us']:.2f} µs"
+              + (f"  caption fayl {r['caption_store_mb']:.1f} MB" if "caption_store_mb" in r else ""))
+    d, c = results["dict"], results["compact"]
+    print(f"tejov: RSS x{d['rss_mb'] / max(c['rss_mb'], 0.1):.1f}, heap x{d['heap_mb'] / max(c['heap_mb'], 0.1):.1f}")
+
+
+if __name__ == "__main__":
+    main()
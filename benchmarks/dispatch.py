@@ -0,0 +1,134 @@
+"""
+Update marshrutlash narxi: eski lambda filtrlar zanjiri va Router (prefiks/aniq matn lug‘ati).
+Ikkala Dispatcher ham bot.router jadvalidagi bir xil marshrutlardan, bo‘sh handlerlar bilan
+quriladi, shuning uchun faqat handler tanlash (filtrlar + FSM holati) o‘lchanadi.
+
+    python benchmarks/dispatch.py [-n 20000]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+TMP = tempfile.mkdtemp(prefix="kino_dispatch_")
+os.environ["MOVIES_FILE"] = os.path.join(TMP, "movies.json")
+os.environ["MOVIES_JOURNAL"] = os.path.join(TMP, "movies.journal.jsonl")
+os.environ.setdefault("BOT_TOKEN", "123456:BENCHMARKBENCHMARKBENCHMARKBENCHMA")
+
+import bot  # noqa: E402
+from aiogram import Bot, Dispatcher, types  # noqa: E402
+from aiogram.contrib.fsm_storage.memory import MemoryStorage  # noqa: E402
+
+SAMPLES = {
+    "cb watch2_": "watch2_1234_abcdefgh",
+    "cb series_ep": "series_ep:1234:7",
+    "cb find": "find:1234",
+    "cb stats_refresh": "stats_refresh",
+    "cb check_sub": "check_sub",
+    "cb edit_delete (holat mos emas)": "edit_delete:1234",
+    "cb noma'lum": "zzz",
+    "msg menyu": "📊 Statistika",
+    "msg kod": "1234",
+    "msg nom": "Forsaj",
+}
+
+
+async def noop(obj, *args, **kwargs):
+    return None
+
+
+def _common_head(dp: Dispatcher) -> None:
+    dp.register_message_handler(noop, lambda m: "bekor" in (m.text or "").lower(), state="*")
+    dp.register_message_handler(noop, commands=["start"])
+    dp.register_message_handler(noop, lambda m: m.text and m.text.strip().isdigit())
+
+
+def _common_tail(dp: Dispatcher) -> None:
+    dp.register_message_handler(noop, lambda m: m.text and not m.text.startswith("/"))
+    dp.register_message_handler(noop, content_types=types.ContentType.ANY, state="*")
+
+
+def linear_dp(b: Bot) -> Dispatcher:
+    """Oldingi holat: har bir marshrut alohida handler va lambda filtr, manbadagi tartibda."""
+    dp = Dispatcher(b, storage=MemoryStorage())
+    _common_head(dp)
+    for text in bot.router.texts:
+        dp.register_message_handler(noop, lambda m, t=text: m.text == t)
+    _common_tail(dp)
+    for key, route in bot.router.callbacks.items():
+        if route.factory is not None:
+            flt = (lambda c, p=key + ":": c.data.startswith(p))
+        elif key.endswith("_"):
+            flt = (lambda c, p=key: c.data.startswith(p))
+        else:
+            flt = (lambda c, k=key: c.data == k)
+        dp.register_callback_query_handler(noop, flt, state=route.state)
+    return dp
+
+
+def routed_dp(b: Bot) -> Dispatcher:
+    dp = Dispatcher(b, storage=MemoryStorage())
+    router = bot.Router()
+    for key, route in bot.router.callbacks.items():
+        router.callback(route.factory or key, state=route.state)(noop)
+    router.text(*bot.router.texts)(noop)
+    _common_head(dp)
+    router.setup(dp)
+    _common_tail(dp)
+    return dp
+
+
+def make_callback(i: int, data: str) -> types.Update:
+    user = {"id": 42, "is_bot": False, "first_name": "u"}
+    chat = {"id": 42, "type": "private"}
+    return types.Update.to_object({"update_id": i, "callback_query": {
+        "id": str(i), "from": user, "chat_instance": "1", "data": data,
+        "message": {"message_id": i, "date": 0, "chat": chat, "text": "x"}}})
+
+
+def make_message(i: int, text: str) -> types.Update:
+    return types.Update.to_object({"update_id": i, "message": {
+        "message_id": i, "date": 0, "text": text, "chat": {"id": 42, "type": "private"},
+        "from": {"id": 42, "is_bot": False, "first_name": "u"}}})
+
+
+async def measure(dp: Dispatcher, upd: types.Update, n: int) -> float:
+    for _ in range(200):
+        await dp.process_update(upd)
+    t0 = time.perf_counter()
+    for _ in range(n):
+        await dp.process_update(upd)
+    return (time.perf_counter() - t0) / n * 1e6
+
+
+async def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-n", type=int, default=20_000)
+    args = ap.parse_args()
+
+    b = Bot(os.environ["BOT_TOKEN"])
+    Bot.set_current(b)
+    before, after = linear_dp(b), routed_dp(b)
+    print(f"{len(bot.router.callbacks)} callback marshrut, {len(bot.router.texts)} menyu matni, "
+          f"{args.n} update/namuna (µs/update)")
+    print(f"{'namuna':<34}{'oldin':>10}{'keyin':>10}{'tezlanish':>12}")
+    totals = [0.0, 0.0]
+    for name, data in SAMPLES.items():
+        upd = make_message(1, data) if name.startswith("msg") else make_callback(1, data)
+        t_before = await measure(before, upd, args.n)
+        t_after = await measure(after, upd, args.n)
+        totals[0] += t_before
+        totals[1] += t_after
+        print(f"{name:<34}{t_before:>10.1f}{t_after:>10.1f}{t_before / t_after:>11.1f}x")
+    print(f"{'o‘rtacha':<34}{totals[0] / len(SAMPLES):>10.1f}{totals[1] / len(SAMPLES):>10.1f}"
+          f"{totals[0] / totals[1]:>11.1f}x")
+    await (await b.get_session()).close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,274 @@
+"""
+Yuklama testi: lokal soxta Telegram Bot API (aiohttp) + dp orqali sintetik update oqimi.
+Har bir oqim (kod bo‘yicha qidiruv, film ko‘rish, serial qismi, nom bo‘yicha qidiruv,
+admin tahrirlash FSM oqimi) uchun o‘tkazuvchanlik va p50/p95/p99 kechikish chiqariladi.
+"edit" oqimida har sessiya oxirida FSM holati tekshiriladi (noto‘g‘ri bo‘lsa — "fsm xato").
+
+    python benchmarks/load_test.py [--titles 20000] [-n 5000] [-c 200] [--api-latency 20]
+    python benchmarks/load_test.py --flows search,watch --paced     # Telegram limitlari bilan
+    python benchmarks/load_test.py --pool                            # update_pool (shardlar) orqali
+
+Odatda yuborish navbati limitlari o‘chiriladi (bot.py hot path o‘lchanadi); --paced ularni qoldiradi.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import socket
+import statistics
+import sys
+import tempfile
+import time
+from collections import Counter
+
+from aiohttp import web
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+TOKEN = "123456:LOADTESTLOADTESTLOADTESTLOADTESTLOA"
+FLOWS = ("search", "watch", "series", "title", "edit")
+EDIT_DONE = "EditFlow:choose_action"
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def setup_env(args, port: int) -> str:
+    tmp = tempfile.mkdtemp(prefix="kino_load_")
+    os.environ.update({
+        "BOT_TOKEN": TOKEN,
+        "TELEGRAM_API_URL": f"http://127.0.0.1:{port}",
+        "BOT_MODE": "polling",
+        "MOVIES_FILE": os.path.join(tmp, "movies.json"),
+        "MOVIES_JOURNAL": os.path.join(tmp, "movies.journal.jsonl"),
+        "STATS_FILE": os.path.join(tmp, "statistics.json"),
+        "MEMBERS_FILE": os.path.join(tmp, "members.json"),
+        "ANALYTICS_FILE": os.path.join(tmp, "analytics.bin"),
+        "BROADCAST_FILE": os.path.join(tmp, "broadcast.json"),
+        "FORCE_SUB_ENABLED": "true",
+        "FORCE_SUB_1_ID": "-1001",
+        "FORCE_SUB_2_ID": "-1002",
+        "ADMIN_ID": "1",
+    })
+    if args.pool:
+        os.environ.setdefault("UPDATE_WORKERS", "32")     # bot.py da odatda o‘chiq
+    if not args.paced:
+        os.environ.update({"SEND_GLOBAL_RATE": "1000000", "SEND_BURST": "1000000",
+                           "SEND_CHAT_INTERVAL": "0", "SEND_GROUP_INTERVAL": "0"})
+    return tmp
+
+
+# ---------------- soxta Bot API ----------------
+class FakeTelegram:
+    def __init__(self, latency: float, member_ratio: float) -> None:
+        self.latency = latency
+        self.member_ratio = member_ratio
+        self.calls: Counter = Counter()
+        self._msg_ids = itertools.count(1)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.calls[method] += 1
+        if request.content_type == "application/json":
+            data = await request.json()
+        else:
+            data = dict(await request.post())
+        if self.latency:
+            await asyncio.sleep(self.latency * random.uniform(0.5, 1.5))
+        return web.json_response({"ok": True, "result": self.result(method, data)})
+
+    def result(self, method: str, data: dict):
+        chat_id = int(data.get("chat_id") or data.get("user_id") or 0)
+        if method == "getChatMember":
+            status = "member" if random.random() < self.member_ratio else "left"
+            return {"status": status, "user": {"id": int(data["user_id"]), "is_bot": False, "first_name": "u"}}
+        if method == "copyMessage":
+            return {"message_id": next(self._msg_ids)}
+        if method.startswith("send") or method.startswith("edit"):
+            return {"message_id": next(self._msg_ids), "date": int(time.time()),
+                    "chat": {"id": chat_id, "type": "private"}}
+        if method == "getMe":
+            return {"id": 123456, "is_bot": True, "first_name": "kino", "username": "kino_bot"}
+        return True
+
+    async def start(self, port: int) -> web.AppRunner:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", port).start()
+        return runner
+
+
+# ---------------- sintetik katalog va update'lar ----------------
+def make_catalog(n: int) -> dict:
+    rnd = random.Random(1)
+    words = ["Forsaj", "Yura", "davri", "Titanik", "Qasoskorlar", "Muzlik", "Shoh", "Sher", "Mehr", "Sabr", "Yo‘l", "Tun"]
+    db = {}
+    for i in range(n):
+        code = str(1000 + i)
+        caption = f"🎬 {' '.join(rnd.sample(words, 2))} {i}"
+        if i % 5 == 0:
+            db[code] = {
+                "type": "series", "poster_file_id": f"P{i}", "poster_caption": caption, "channel_msg_id": None,
+                "episodes": {str(e): {"video_file_id": f"V{i}_{e}", "video_unique_id": f"U{i}_{e}", "title": ""}
+                             for e in range(1, 13)},
+            }
+        else:
+            db[code] = {"type": "movie", "post_file_id": f"P{i}", "post_caption": caption,
+                        "video_file_id": f"V{i}", "video_unique_id": f"U{i}", "channel_msg_id": None}
+    return db
+
+
+_update_ids = itertools.count(1)
+_edit_admins = itertools.count(900_000)
+
+
+def _user(uid: int) -> dict:
+    return {"id": uid, "is_bot": False, "first_name": f"u{uid}"}
+
+
+def message_update(uid: int, text: str) -> dict:
+    i = next(_update_ids)
+    return {"update_id": i, "message": {"message_id": i, "date": int(time.time()), "text": text,
+                                        "chat": {"id": uid, "type": "private"}, "from": _user(uid)}}
+
+
+def callback_update(uid: int, data: str) -> dict:
+    i = next(_update_ids)
+    return {"update_id": i, "callback_query": {
+        "id": str(i), "from": _user(uid), "chat_instance": "1", "data": data,
+        "message": {"message_id": i, "date": int(time.time()), "chat": {"id": uid, "type": "private"}, "text": "x"},
+    }}
+
+
+def make_updates(bot, flow: str, n: int, users: int, db: dict, rnd: random.Random) -> list:
+    movies = [c for c, v in db.items() if v["type"] == "movie"]
+    series = [c for c, v in db.items() if v["type"] == "series"]
+    out = []
+    if flow == "edit":
+        # admin sessiyalari: menyu -> turi (callback) -> kod; sessiyalar aralashtirib yuboriladi
+        sessions = []
+        for _ in range(max(1, n // 3)):
+            uid = next(_edit_admins)
+            bot.ADMINS.add(uid)
+            sessions.append([message_update(uid, "✏️ Tahrirlash"), callback_update(uid, "edit_type:movie"),
+                             message_update(uid, rnd.choice(movies))])
+        for step in range(3):
+            out.extend(sess[step] for sess in sessions)
+        return out
+    for _ in range(n):
+        uid = 100_000 + rnd.randrange(users)
+        if flow == "search":
+            out.append(message_update(uid, rnd.choice(movies + series)))
+        elif flow == "watch":
+            code = rnd.choice(movies)
+            out.append(callback_update(uid, f"watch2_{code}_{bot.make_watch_token(code, uid)}"))
+        elif flow == "series":
+            out.append(callback_update(uid, f"series_ep:{rnd.choice(series)}:{rnd.randint(1, 12)}"))
+        else:
+            code = rnd.choice(movies)
+            out.append(message_update(uid, bot.item_title(db[code]).split(" ", 1)[1]))
+    return out
+
+
+async def drive(bot, types, raw_updates: list, concurrency: int, pool: bool):
+    sem = asyncio.Semaphore(concurrency)
+    lat = []
+    errors = 0
+
+    async def one(raw: dict) -> None:
+        nonlocal errors
+        upd = types.Update.to_object(raw)
+        async with sem:
+            t0 = time.perf_counter()
+            try:
+                if pool:    # navbatda kutish ham kechikishga kiradi
+                    await (await bot.update_pool.submit(bot.dp, upd, want_result=True))
+                else:
+                    await bot.dp.process_update(upd)
+            except Exception:
+                errors += 1
+            lat.append(time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one(u) for u in raw_updates))
+    return time.perf_counter() - t0, sorted(lat), errors
+
+
+async def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--titles", type=int, default=20_000)
+    ap.add_argument("-n", type=int, default=5_000, help="har bir oqim uchun update soni")
+    ap.add_argument("-c", type=int, default=200, help="bir vaqtda ishlanadigan update'lar")
+    ap.add_argument("--users", type=int, default=20_000)
+    ap.add_argument("--api-latency", type=float, default=20, help="soxta API javob vaqti, ms (±50%%)")
+    ap.add_argument("--member-ratio", type=float, default=1.0, help="getChatMember: obuna bo‘lganlar ulushi")
+    ap.add_argument("--flows", default=",".join(FLOWS))
+    ap.add_argument("--paced", action="store_true", help="Telegram yuborish limitlarini o‘chirmaslik")
+    ap.add_argument("--pool", action="store_true", help="update'larni UPDATE_WORKERS (odatda 32) shardlari orqali o‘tkazish")
+    ap.add_argument("--json", action="store_true", help="natijani JSON qilib chiqarish")
+    args = ap.parse_args()
+
+    port = free_port()
+    setup_env(args, port)
+    import bot  # noqa: E402  (env o‘rnatilgandan keyin)
+    from aiogram import Bot, Dispatcher, types
+
+    db = make_catalog(args.titles)
+    with open(os.environ["MOVIES_FILE"], "w", encoding="utf-8") as f:
+        json.dump(db, f, ensure_ascii=False)
+
+    fake = FakeTelegram(args.api_latency / 1000, args.member_ratio)
+    runner = await fake.start(port)
+    Bot.set_current(bot.bot)
+    Dispatcher.set_current(bot.dp)
+    await bot.run_io(bot.load_db)
+    await bot.run_io(bot._stats_engine)
+    await bot.run_io(bot._analytics_engine)
+    await bot.rebuild_search_index()
+
+    rnd = random.Random(2)
+    report = {}
+    print(f"katalog {args.titles}, {args.n} update/oqim, c={args.c}, API {args.api_latency:.0f} ms, "
+          f"{'paced' if args.paced else 'limitsiz'}"
+          + (f", pool {bot.update_pool.workers}x{bot.update_pool.per_shard}" if args.pool else ""))
+    for flow in args.flows.split(","):
+        fake.calls.clear()
+        updates = make_updates(bot, flow, args.n, args.users, db, rnd)
+        total, lat, errors = await drive(bot, types, updates, args.c, args.pool)
+        q = statistics.quantiles(lat, n=100)
+        report[flow] = {
+            "updates": len(lat), "seconds": round(total, 3), "rps": round(len(lat) / total, 1),
+            "p50_ms": round(q[49] * 1e3, 2), "p95_ms": round(q[94] * 1e3, 2), "p99_ms": round(q[98] * 1e3, 2),
+            "errors": errors, "api_calls": dict(fake.calls),
+        }
+        if flow == "edit":
+            uids = {u["message"]["from"]["id"] for u in updates if "message" in u}
+            states = [await bot.dp.current_state(chat=uid, user=uid).get_state() for uid in uids]
+            report[flow]["fsm_errors"] = sum(st != EDIT_DONE for st in states)
+        if args.pool:
+            w = bot.metrics.update_wait
+            report[flow]["queue_wait_p95_ms"] = round(max(h.quantile(0.95) for h in w.values()) * 1e3, 2)
+            w.clear()
+        r = report[flow]
+        print(f"{flow:<7} {r['rps']:>8.0f} upd/s  p50 {r['p50_ms']:>7.1f}  p95 {r['p95_ms']:>7.1f}  "
+              f"p99 {r['p99_ms']:>7.1f} ms  xato {errors}"
+              + (f"  fsm xato {r['fsm_errors']}" if "fsm_errors" in r else "") + f"  API {dict(fake.calls)}")
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+
+    await bot.compact_catalog()
+    await (await bot.bot.get_session()).close()
+    await runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
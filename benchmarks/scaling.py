@@ -0,0 +1,122 @@
+"""
+Hajm o‘sganda katalog/statistika funksiyalari: vaqt va xotira egri chiziqlari.
+Har bir qadamda synth.py bilan movies.json + statistics.json yaratiladi.
+
+    python benchmarks/scaling.py
+    python benchmarks/scaling.py --titles 1000,10000,100000 --users 10000,100000,1000000 --huge-series 10000
+    python benchmarks/scaling.py --csv scaling.csv
+
+Xotira tracemalloc bilan alohida o‘tishda o‘lchanadi (retained = chaqiruvdan keyin qolgani).
+"""
+import argparse
+import csv
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+TMP = tempfile.mkdtemp(prefix="kino_scale_")
+os.environ.update({
+    "MOVIES_FILE": os.path.join(TMP, "movies.json"),
+    "MOVIES_JOURNAL": os.path.join(TMP, "movies.journal.jsonl"),
+    "STATS_FILE": os.path.join(TMP, "statistics.json"),
+    "ANALYTICS_FILE": os.path.join(TMP, "analytics.bin"),
+    "STATS_FLUSH_EVERY": str(10 ** 9),     # fon flush bu yerda kerak emas
+})
+os.environ.setdefault("BOT_TOKEN", "123456:BENCHMARKBENCHMARKBENCHMARKBENCHMA")
+
+import bot  # noqa: E402
+import synth  # noqa: E402
+
+
+def reset() -> None:
+    bot._catalog_loaded = False
+    bot._catalog = {}
+    bot._video_index.clear()
+    bot.invalidate_search_index()
+    bot._install_search_tables(({}, {}, {}))    # eski indeks xotirada qolmasin
+    bot.invalidate_episode_cache()
+    bot._code_pool = None
+    bot._stats.loaded = False
+    bot._stats.users = set()
+    bot._stats.pending = 0
+
+
+def timed(fn, *args, repeat: int = 1) -> float:
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        fn(*args)
+    return (time.perf_counter() - t0) / repeat
+
+
+def traced(fn, *args):
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    fn(*args)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return (current - base) / 1e6, (peak - base) / 1e6
+
+
+def step(titles: int, users: int, huge_series: int, with_mem: bool) -> dict:
+    db = synth.make_catalog(titles, huge_series=huge_series)
+    movies_mb = synth.write_json(os.environ["MOVIES_FILE"], db) / 1e6
+    stats_mb = synth.write_json(os.environ["STATS_FILE"], synth.make_stats(users)) / 1e6
+    vids = [v for item in db.values() for v, _ in bot._item_videos(item)]
+    del db
+    reset()
+
+    row = {"titles": titles, "users": users, "movies_mb": round(movies_mb, 1), "stats_mb": round(stats_mb, 1)}
+    row["read_db_file_ms"] = timed(bot._read_db_file) * 1e3
+    row["load_db_cold_ms"] = timed(bot.load_db) * 1e3
+    row["get_item_us"] = timed(bot.get_item, "1000", repeat=10_000) * 1e6
+    row["video_owner_us"] = timed(lambda: [bot.find_video_owner(v) for v in vids[:1000]]) * 1e3
+    row["search_build_ms"] = timed(bot._search_build) * 1e3
+    row["stats_load_ms"] = timed(bot._stats_engine) * 1e3
+    row["update_stats_us"] = timed(bot.update_stats, 42, "1000", repeat=10_000) * 1e6
+    row["stats_text_ms"] = timed(bot.stats_text, repeat=10) * 1e3
+    row["flush_stats_ms"] = timed(bot.flush_stats) * 1e3
+    row["write_all_ms"] = timed(bot._write_all, dict(bot._catalog)) * 1e3
+
+    if with_mem:
+        reset()
+        row["load_db_mb"], row["load_db_peak_mb"] = traced(bot.load_db)
+        row["search_index_mb"], _ = traced(bot._search_build)
+        row["stats_mb_mem"], row["stats_peak_mb"] = traced(bot._stats_engine)
+    return {k: round(v, 2) if isinstance(v, float) else v for k, v in row.items()}
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--titles", default="1000,10000,50000,100000")
+    ap.add_argument("--users", default="10000,100000,500000,1000000")
+    ap.add_argument("--huge-series", type=int, default=0)
+    ap.add_argument("--no-mem", action="store_true")
+    ap.add_argument("--csv")
+    args = ap.parse_args()
+
+    titles = [int(x) for x in args.titles.split(",")]
+    users = [int(x) for x in args.users.split(",")]
+    users += [users[-1]] * (len(titles) - len(users))
+
+    rows = []
+    for t, u in zip(titles, users):
+        row = step(t, u, args.huge_series, not args.no_mem)
+        rows.append(row)
+        print("  ".join(f"{k}={v}" for k, v in row.items()), flush=True)
+
+    if args.csv:
+        with open(args.csv, "w", newline="", encoding="utf-8") as f:
+            w = csv.DictWriter(f, fieldnames=list(rows[0]))
+            w.writeheader()
+            w.writerows(rows)
+        print(f"-> {args.csv}")
+
+
+if __name__ == "__main__":
+    main()
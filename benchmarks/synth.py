@@ -0,0 +1,118 @@
+"""
+Sintetik movies.json va statistics.json (katta hajmdagi sinovlar uchun).
+
+    python benchmarks/synth.py --titles 100000 --users 1000000 --out /tmp/kino_100k
+    python benchmarks/synth.py --titles 5000 --huge-series 10000 --out /tmp/kino_big_series
+
+Katalogda hozirgi formatdagi filmlar/seriallar, eski format (type yo‘q) itemlar,
+lotin va kirill captionlar bo‘ladi. Natija bir xil seed bilan bir xil chiqadi.
+"""
+import argparse
+import json
+import os
+import random
+import time
+
+LATIN = ["Forsaj", "Yura", "davri", "Qasoskorlar", "Muzlik", "Shoh", "Sher", "Mehr", "Sabr", "Yo‘l", "Tun",
+         "O‘g‘ri", "Qirol", "Sirli", "orol", "Oxirgi", "jang", "Sevgi", "va", "nafrat", "Qora", "ritsar"]
+CYRILLIC = ["Форсаж", "Юрский", "период", "Мстители", "Ледниковый", "Король", "Лев", "Ночь", "Последний",
+            "бой", "Тайна", "остров", "Любовь", "Тёмный", "рыцарь", "Ўзбек", "қўшиқ", "Ғалаба"]
+GENRES = ["Jangari", "Komediya", "Drama", "Fantastika", "Tarixiy", "Melodrama", "Боевик", "Комедия"]
+
+
+def _caption(rnd: random.Random, icon: str, i: int) -> str:
+    words = CYRILLIC if rnd.random() < 0.3 else LATIN
+    title = " ".join(rnd.sample(words, rnd.randint(1, 3)))
+    return (
+        f"{icon} {title} {i}\n"
+        f"🎭 Janr: {rnd.choice(GENRES)}\n"
+        f"📅 Yil: {rnd.randint(1970, 2025)}\n"
+        + "Qisqacha: " + " ".join(rnd.choice(words) for _ in range(rnd.randint(5, 30)))
+    )
+
+
+def _episodes(i: int, count: int, rnd: random.Random) -> dict:
+    return {
+        str(e): {
+            "video_file_id": f"BAACAgIAAxkBAAI{i:08d}{e:06d}",
+            "video_unique_id": f"AgAD{i:08d}{e:06d}",
+            "title": rnd.choice(LATIN) if rnd.random() < 0.3 else "",
+        }
+        for e in range(1, count + 1)
+    }
+
+
+def make_catalog(titles: int, series_ratio: float = 0.1, legacy_ratio: float = 0.04,
+                 max_episodes: int = 40, huge_series: int = 0, seed: int = 42) -> dict:
+    """huge_series > 0 bo‘lsa birinchi item shuncha qismli serial bo‘ladi."""
+    rnd = random.Random(seed)
+    db = {}
+    for i in range(titles):
+        code = str(1000 + i) if i < 9000 else str(10000 + i)
+        r = rnd.random()
+        if (i == 0 and huge_series) or r < series_ratio:
+            n_eps = huge_series if i == 0 and huge_series else rnd.randint(2, max_episodes)
+            db[code] = {
+                "type": "series",
+                "poster_file_id": f"AgACAgIAAxkBAAI{i:012d}",
+                "poster_caption": _caption(rnd, "📺", i),
+                "episodes": _episodes(i, n_eps, rnd),
+                "channel_msg_id": rnd.choice([None, i]),
+            }
+        elif r < series_ratio + legacy_ratio:
+            db[code] = {    # eski format: type yo‘q
+                "post_file_id": f"AgACAgIAAxkBAAI{i:012d}",
+                "post_caption": _caption(rnd, "🎬", i),
+                "video_file_id": f"BAACAgIAAxkBAAI{i:012d}",
+                "video_unique_id": f"AgAD{i:012d}",
+            }
+        else:
+            db[code] = {
+                "type": "movie",
+                "post_file_id": f"AgACAgIAAxkBAAI{i:012d}",
+                "post_caption": _caption(rnd, "🎬", i),
+                "video_file_id": f"BAACAgIAAxkBAAI{i:012d}",
+                "video_unique_id": f"AgAD{i:012d}",
+                "channel_msg_id": rnd.choice([None, i]),
+            }
+    return db
+
+
+def make_stats(users: int, seed: int = 42) -> dict:
+    rnd = random.Random(seed)
+    ids = rnd.sample(range(10_000_000, 10_000_000 + users * 20), users) if users else []
+    return {
+        "users": ids,
+        "total_requests": users * rnd.randint(3, 30),
+        "today": {"date": time.strftime("%Y-%m-%d"), "count": rnd.randint(0, users)},
+    }
+
+
+def write_json(path: str, data: dict) -> int:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    return os.path.getsize(path)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--titles", type=int, default=100_000)
+    ap.add_argument("--users", type=int, default=100_000)
+    ap.add_argument("--series-ratio", type=float, default=0.1)
+    ap.add_argument("--legacy-ratio", type=float, default=0.04)
+    ap.add_argument("--max-episodes", type=int, default=40)
+    ap.add_argument("--huge-series", type=int, default=0, help="bitta serialga shuncha qism")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--out", default=".")
+    args = ap.parse_args()
+
+    os.makedirs(args.out, exist_ok=True)
+    db = make_catalog(args.titles, args.series_ratio, args.legacy_ratio, args.max_episodes, args.huge_series, args.seed)
+    size = write_json(os.path.join(args.out, "movies.json"), db)
+    print(f"movies.json: {len(db)} ta item, {size / 1e6:.1f} MB")
+    size = write_json(os.path.join(args.out, "statistics.json"), make_stats(args.users, args.seed))
+    print(f"statistics.json: {args.users} ta user, {size / 1e6:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
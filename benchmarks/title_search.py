@@ -0,0 +1,102 @@
+"""
+Nom bo‘yicha qidiruv: indeksni qurish vaqti va so‘rov vaqti (xato yozilgan, kirill, qisman so‘zlar).
+
+    python benchmarks/title_search.py [titles] [queries]
+"""
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+TMP = tempfile.mkdtemp(prefix="kino_bench_")
+os.environ["MOVIES_FILE"] = os.path.join(TMP, "movies.json")
+os.environ["MOVIES_JOURNAL"] = os.path.join(TMP, "movies.journal.jsonl")
+os.environ.setdefault("BOT_TOKEN", "123456:BENCHMARKBENCHMARKBENCHMARKBENCHMA")
+
+import bot  # noqa: E402
+
+SYLLABLES = [c + v for c in ["b", "d", "f", "g", "h", "j", "k", "l", "m", "n", "p", "q", "r", "s", "t", "v", "x", "y", "z",
+                              "sh", "ch", "g‘"] for v in "aeiou"] + ["o‘", "bek", "gul", "xon", "tor"]
+GENRES = ["Jangari", "Komediya", "Drama", "Fantastika", "Tarixiy", "Melodrama", "Triller", "Multfilm"]
+
+
+def make_word(rnd: random.Random) -> str:
+    return "".join(rnd.choice(SYLLABLES) for _ in range(rnd.randint(2, 4))).capitalize()
+
+
+def make_catalog(n: int, rnd: random.Random) -> dict:
+    db = {}
+    for i in range(n):
+        code = str(1000 + i)
+        title = " ".join(make_word(rnd) for _ in range(rnd.randint(1, 3)))
+        caption = f"🎬 {title}\n🎭 Janr: {rnd.choice(GENRES)}\n📅 Yil: {rnd.randint(1980, 2025)}\n🆔 Kod: {code}"
+        if i % 10 == 0:
+            db[code] = {
+                "type": "series",
+                "poster_file_id": f"AgAC{i:012d}",
+                "poster_caption": caption,
+                "episodes": {str(e): {"video_file_id": f"BAAC{i:08d}{e:04d}", "video_unique_id": f"AgAD{i:08d}{e:04d}",
+                                      "title": make_word(rnd)} for e in range(1, 6)},
+                "channel_msg_id": None,
+            }
+        else:
+            db[code] = {
+                "type": "movie",
+                "post_file_id": f"AgAC{i:012d}",
+                "post_caption": caption,
+                "video_file_id": f"BAAC{i:012d}",
+                "video_unique_id": f"AgAD{i:012d}",
+                "channel_msg_id": i,
+            }
+    return db
+
+
+def typo(word: str, rnd: random.Random) -> str:
+    if len(word) < 4:
+        return word
+    i = rnd.randrange(1, len(word) - 1)
+    return word[:i] + word[i + 1:]
+
+
+def main() -> None:
+    titles = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    queries = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    rnd = random.Random(7)
+    db = make_catalog(titles, rnd)
+    with open(os.environ["MOVIES_FILE"], "w", encoding="utf-8") as f:
+        json.dump(db, f, ensure_ascii=False)
+
+    bot.load_db()
+    t0 = time.perf_counter()
+    bot._search_build()
+    print(f"katalog: {titles} ta, indeks: {len(bot._search_words)} so‘z, "
+          f"{len(bot._search_grams)} trigram, qurish {time.perf_counter() - t0:.2f}s")
+
+    codes = list(db)
+    samples, hits = [], 0
+    for _ in range(queries):
+        code = rnd.choice(codes)
+        words = bot.item_title(db[code]).split()[1:]
+        q = " ".join(typo(w, rnd) for w in words)
+        t0 = time.perf_counter()
+        res = bot.search_titles(q)
+        samples.append(time.perf_counter() - t0)
+        hits += code in {c for c, _ in res}
+    samples.sort()
+    q = statistics.quantiles(samples, n=100)
+    print(f"{queries} so‘rov (1 harf tushib qolgan): top-{bot.SEARCH_RESULTS} ichida topildi {hits / queries:.0%}")
+    print(f"p50 {q[49] * 1e3:.2f} ms  p95 {q[94] * 1e3:.2f} ms  max {samples[-1] * 1e3:.2f} ms")
+    for q in ("Жангари", "komediya", "qo‘rqinchli"):
+        t0 = time.perf_counter()
+        res = bot.search_titles(q)
+        print(f"{q!r:>16}: {len(res)} natija, {(time.perf_counter() - t0) * 1e3:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
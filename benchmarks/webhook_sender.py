@@ -0,0 +1,83 @@
+"""
+Lokal "Telegram": webhook rejimidagi botga soxta update'larni POST qiladi
+(secret token sarlavhasi bilan) va javob vaqti/tanasini ko‘rsatadi.
+
+    BOT_MODE=webhook WEBHOOK_SECRET=s3cret python bot.py
+    python benchmarks/webhook_sender.py http://127.0.0.1:8080/webhook s3cret --kind callback --data check_sub -n 200 -c 20
+
+Callback update'larga javob (answerCallbackQuery) webhook javobining o‘zida qaytsa,
+tanada "method": "answerCallbackQuery" ko‘rinadi.
+"""
+import argparse
+import asyncio
+import itertools
+import statistics
+import sys
+import time
+
+import aiohttp
+
+_ids = itertools.count(1)
+
+
+def make_update(kind: str, user_id: int, data: str) -> dict:
+    uid = next(_ids)
+    user = {"id": user_id, "is_bot": False, "first_name": f"u{user_id}"}
+    chat = {"id": user_id, "type": "private"}
+    if kind == "callback":
+        return {
+            "update_id": uid,
+            "callback_query": {
+                "id": str(uid),
+                "from": user,
+                "chat_instance": "1",
+                "data": data,
+                "message": {"message_id": uid, "date": int(time.time()), "chat": chat, "text": "x"},
+            },
+        }
+    return {
+        "update_id": uid,
+        "message": {"message_id": uid, "date": int(time.time()), "chat": chat, "from": user, "text": data},
+    }
+
+
+async def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("url")
+    ap.add_argument("secret", nargs="?", default="")
+    ap.add_argument("--kind", choices=("callback", "text"), default="callback")
+    ap.add_argument("--data", default="check_sub")
+    ap.add_argument("-n", type=int, default=100)
+    ap.add_argument("-c", type=int, default=10)
+    ap.add_argument("--users", type=int, default=1000)
+    args = ap.parse_args()
+
+    headers = {"X-Telegram-Bot-Api-Secret-Token": args.secret} if args.secret else {}
+    sem = asyncio.Semaphore(args.c)
+    lat, statuses, sample = [], {}, None
+
+    async with aiohttp.ClientSession(headers=headers) as s:
+        async def one(i: int) -> None:
+            nonlocal sample
+            upd = make_update(args.kind, 10_000 + i % args.users, args.data)
+            async with sem:
+                t0 = time.perf_counter()
+                async with s.post(args.url, json=upd) as r:
+                    body = await r.text()
+                lat.append(time.perf_counter() - t0)
+                statuses[r.status] = statuses.get(r.status, 0) + 1
+                sample = sample or body
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(args.n)))
+        total = time.perf_counter() - t0
+
+    lat.sort()
+    q = statistics.quantiles(lat, n=100) if len(lat) > 1 else lat * 99
+    print(f"{args.n} update, {total:.2f}s, {args.n / total:.0f} upd/s, status: {statuses}")
+    print(f"p50 {q[49] * 1e3:.1f} ms  p95 {q[94] * 1e3:.1f} ms  p99 {q[98] * 1e3:.1f} ms")
+    print(f"javob namunasi: {sample[:200] if sample else ''}")
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
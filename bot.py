@@ -1,20 +1,53 @@
+import asyncio
+import base64
+import bisect
+import contextvars
+import heapq
+import hashlib
+import hmac
+import inspect
+import itertools
+import io
 import json
+import logging
+import math
+import mmap
 import os
 import random
 import re
-from datetime import datetime
+import sqlite3
+import struct
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, OrderedDict
+from collections.abc import Mapping
+from datetime import datetime, timedelta
 from typing import Any, Dict, Optional, List, Tuple
 
 from aiogram import Bot, Dispatcher, executor, types
+from aiogram.bot.api import TELEGRAM_PRODUCTION, TelegramAPIServer
 from aiogram.contrib.fsm_storage.memory import MemoryStorage
 from aiogram.dispatcher import FSMContext
 from aiogram.dispatcher.filters.state import State, StatesGroup
+from aiogram.dispatcher.handler import SkipHandler, ctx_data, current_handler
+from aiogram.dispatcher.middlewares import BaseMiddleware
+from aiogram.dispatcher.webhook import (
+    RESPONSE_TIMEOUT, AnswerCallbackQuery, AnswerInlineQuery, BaseResponse, WebhookRequestHandler,
+)
+from aiogram.utils.callback_data import CallbackData
+from aiogram.utils.exceptions import (
+    BotBlocked, CantInitiateConversation, CantTalkWithBots, ChatNotFound, RetryAfter, UserDeactivated,
+)
+from aiohttp import web
 from dotenv import load_dotenv
 
 # ================== ENV ==================
 load_dotenv()
 
 BOT_TOKEN = os.getenv("BOT_TOKEN")
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "").rstrip("/")    # lokal Bot API server / test stend
 ADMIN_ID = int(os.getenv("ADMIN_ID", "0"))
 
 # Kanal IDlar (K1 baza, K2 biznes)
@@ -29,38 +62,533 @@ FORCE_SUB_2_ID = int(os.getenv("FORCE_SUB_2_ID", "0"))
 FORCE_SUB_2_LINK = os.getenv("FORCE_SUB_2_LINK", "")
 
 FORCE_SUB_ENABLED = (os.getenv("FORCE_SUB_ENABLED", "true").lower() == "true")
+SUB_CACHE_TTL_OK = int(os.getenv("SUB_CACHE_TTL_OK", "300"))       # obuna bo‘lgan: sekund
+SUB_CACHE_TTL_FAIL = int(os.getenv("SUB_CACHE_TTL_FAIL", "10"))    # obuna bo‘lmagan: sekund
+SUB_CACHE_MAX = int(os.getenv("SUB_CACHE_MAX", "100000"))
+MEMBERS_FILE = os.getenv("MEMBERS_FILE", "members.json")     # chat_member orqali kuzatilgan obunachilar
+SUB_TRACKED_MAX_AGE = int(os.getenv("SUB_TRACKED_MAX_AGE", "86400"))   # sekund: kuzatuv yozuvi API bilan qayta tekshiriladi
 
 BOT_USERNAME = (os.getenv("BOT_USERNAME") or "").lstrip("@").strip()
 MOVIES_FILE = os.getenv("MOVIES_FILE", "movies.json")
+MOVIES_BACKEND = os.getenv("MOVIES_BACKEND", "json").lower()    # json / sqlite
+MOVIES_DB_FILE = os.getenv("MOVIES_DB_FILE", "movies.db")
+MOVIES_JOURNAL = os.getenv("MOVIES_JOURNAL", "movies.journal.jsonl")   # JSON backend o‘zgarishlar jurnali
+JOURNAL_COMPACT_EVERY = int(os.getenv("JOURNAL_COMPACT_EVERY", "500"))
+CATALOG_COMPACT = (os.getenv("CATALOG_COMPACT", "false").lower() == "true")   # katta katalog: __slots__ + mmap captionlar
+CATALOG_RECHECK_INTERVAL = float(os.getenv("CATALOG_RECHECK_INTERVAL", "5"))  # sekund: tashqi o‘zgarishni tekshirish
 
 STATS_FILE = os.getenv("STATS_FILE", "statistics.json")
+STATS_FLUSH_INTERVAL = int(os.getenv("STATS_FLUSH_INTERVAL", "30"))   # sekund
+STATS_FLUSH_EVERY = int(os.getenv("STATS_FLUSH_EVERY", "200"))        # so‘rov
+ANALYTICS_FILE = os.getenv("ANALYTICS_FILE", "analytics.bin")          # kod/qism/soat hisoblagichlari
+ANALYTICS_RETENTION_DAYS = int(os.getenv("ANALYTICS_RETENTION_DAYS", "90"))
+ANALYTICS_TOP_N = int(os.getenv("ANALYTICS_TOP_N", "10"))
+ANALYTICS_WINDOW_DAYS = int(os.getenv("ANALYTICS_WINDOW_DAYS", "7"))   # admin ko‘rinishi: oxirgi N kun
+
+# Ishga tushirish rejimi: polling (odatiy) yoki webhook (aiohttp server)
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "").rstrip("/")      # tashqi manzil: https://example.com
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")           # X-Telegram-Bot-Api-Secret-Token
+WEBAPP_HOST = os.getenv("WEBAPP_HOST", "0.0.0.0")
+WEBAPP_PORT = int(os.getenv("WEBAPP_PORT", "8080"))
+
+# Chiqish tezligi (Telegram: ~30 msg/s umumiy, ~1 msg/s bitta chatga, guruh/kanal ~20 msg/min)
+SEND_GLOBAL_RATE = float(os.getenv("SEND_GLOBAL_RATE", "30"))
+SEND_BURST = float(os.getenv("SEND_BURST", "10"))
+SEND_CHAT_INTERVAL = float(os.getenv("SEND_CHAT_INTERVAL", "1.0"))
+SEND_GROUP_INTERVAL = float(os.getenv("SEND_GROUP_INTERVAL", "3.0"))
+SEND_MAX_RETRIES = int(os.getenv("SEND_MAX_RETRIES", "3"))
+
+# Yakka film tugmasi: imzolangan token (restartdan keyin ham ishlaydi)
+WATCH_TOKEN_SECRET = os.getenv("WATCH_TOKEN_SECRET") or hashlib.sha256(f"watch:{BOT_TOKEN}".encode()).hexdigest()
+WATCH_TOKEN_TTL = int(os.getenv("WATCH_TOKEN_TTL", "86400"))       # sekund
+WATCH_REDEEMED_MAX = int(os.getenv("WATCH_REDEEMED_MAX", "200000"))
+
+EPISODES_PAGE_SIZE = int(os.getenv("EPISODES_PAGE_SIZE", "50"))   # serial qismlari: bitta sahifada
+EPISODE_BATCH_DELAY = float(os.getenv("EPISODE_BATCH_DELAY", "1.5"))  # forward to‘plami: shuncha sekund jimlikdan keyin hisobot
+CODE_MIN_DIGITS = int(os.getenv("CODE_MIN_DIGITS", "4"))            # avtokod uzunligi (tugasa 1 xona qo‘shiladi)
+CODE_RESERVE_TTL = int(os.getenv("CODE_RESERVE_TTL", "21600"))        # sekund: tashlab ketilgan band kod bo‘shaydi
+SEARCH_RESULTS = int(os.getenv("SEARCH_RESULTS", "8"))               # nom bo‘yicha qidiruv: tugmalar soni
+SEARCH_MIN_SIMILARITY = float(os.getenv("SEARCH_MIN_SIMILARITY", "0.45"))
+
+# Inline rejim (@bot so‘rov): BotFather'da /setinline yoqilgan bo‘lishi kerak
+INLINE_PAGE_SIZE = int(os.getenv("INLINE_PAGE_SIZE", "20"))         # Telegram: 50 tagacha
+INLINE_MAX_RESULTS = int(os.getenv("INLINE_MAX_RESULTS", "200"))
+INLINE_CACHE_TIME = int(os.getenv("INLINE_CACHE_TIME", "300"))      # Telegram tomonida, sekund
+INLINE_LRU_SIZE = int(os.getenv("INLINE_LRU_SIZE", "2048"))
+
+# Ommaviy xabar (barcha foydalanuvchilarga)
+BROADCAST_FILE = os.getenv("BROADCAST_FILE", "broadcast.json")        # checkpoint; qabul qiluvchilar: <fayl>.users
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "8"))
+BROADCAST_CHECKPOINT_EVERY = int(os.getenv("BROADCAST_CHECKPOINT_EVERY", "200"))   # foydalanuvchi
+BROADCAST_PROGRESS_INTERVAL = float(os.getenv("BROADCAST_PROGRESS_INTERVAL", "5"))  # sekund
+
+# Metrikalar: Prometheus matn formatida http://METRICS_HOST:METRICS_PORT/metrics (0 = o‘chiq)
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
+# Update'larni qayta ishlash: user id bo‘yicha shardlar (0 = aiogram odatiy: har update alohida task).
+# Odatda o‘chiq: shard ichida update'lar ketma-ket, handler ichidagi kutishlar (SendScheduler chat
+# oralig‘i, sekin API) butun shardni ushlab turadi va p99 kechikish oshadi. Yoqish (masalan 32) —
+# bitta userning update'lari aralashib FSM buzilayotgan bo‘lsa yoki xotira/tasklar sonini cheklash kerak
+# bo‘lsa; benchmarks/load_test.py --pool bilan o‘z yuklamangizda solishtirib ko‘ring.
+UPDATE_WORKERS = int(os.getenv("UPDATE_WORKERS", "0"))
+UPDATE_QUEUE_SIZE = int(os.getenv("UPDATE_QUEUE_SIZE", "2000"))     # barcha shardlar bo‘yicha jami
 
 ADMINS = {ADMIN_ID}
 
+# ================== METRIKALAR ==================
+# Handler va Bot API vaqtlari qat'iy chegarali histogrammalarda (bisect + 3 ta qo‘shish),
+# qolganlari oddiy hisoblagich — doim yoqiq qoldirsa bo‘ladi.
+_LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self) -> None:
+        self.counts = [0] * (len(_LATENCY_BUCKETS) + 1)    # oxirgisi: +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(_LATENCY_BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        # bucket ichida chiziqli taxmin
+        rank, seen = q * self.count, 0
+        for i, c in enumerate(self.counts):
+            if c and seen + c >= rank:
+                lo = _LATENCY_BUCKETS[i - 1] if i else 0.0
+                hi = _LATENCY_BUCKETS[i] if i < len(_LATENCY_BUCKETS) else lo
+                return lo + (hi - lo) * (rank - seen) / c
+            seen += c
+        return 0.0
+
+class Metrics:
+    def __init__(self) -> None:
+        self.handlers: Dict[str, Histogram] = {}    # handler funksiya nomi
+        self.api: Dict[str, Histogram] = {}         # Bot API metodi
+        self.api_errors: Counter = Counter()
+        self.update_wait: Dict[str, Histogram] = {}  # update turi: navbatda kutish
+        self.counters: Counter = Counter()          # storage_load, storage_save_batch, ...
+
+    @staticmethod
+    def observe(family: Dict[str, Histogram], name: str, value: float) -> None:
+        h = family.get(name)
+        if h is None:
+            h = family[name] = Histogram()
+        h.observe(value)
+
+metrics = Metrics()
+
+# ================== YUBORISH NAVBATI ==================
+# Barcha yuborish/tahrirlash chaqiruvlari shu navbatdan o‘tadi:
+# umumiy token bucket + har bir chat uchun oraliq + ustuvorlik (user javoblari kanal postlaridan oldin).
+# 429 (RetryAfter) kelsa o‘sha chat (chat bo‘lmasa hammasi) kutadi va so‘rov qayta yuboriladi.
+PRIO_USER = 0
+PRIO_BULK = 1
+
+# Kanal/ommaviy yuborishlar uchun: send_priority.set(PRIO_BULK)
+send_priority: contextvars.ContextVar = contextvars.ContextVar("send_priority", default=PRIO_USER)
+
+_PACED_METHODS = {
+    "sendMessage", "sendPhoto", "sendVideo", "sendDocument", "sendAnimation", "sendAudio",
+    "sendVoice", "sendMediaGroup", "copyMessage", "forwardMessage",
+    "editMessageText", "editMessageCaption", "editMessageMedia", "editMessageReplyMarkup",
+}
+
+class SendScheduler:
+    def __init__(self, rate: float, burst: float, chat_interval: float, group_interval: float) -> None:
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self.chat_interval = chat_interval
+        self.group_interval = group_interval
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._heap: List[Tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._chat_next: Dict[Any, float] = {}     # navbatga yozilgan keyingi slot
+        self._chat_sent: Dict[Any, float] = {}     # oxirgi haqiqiy yuborish
+        self._wakeup: Optional[asyncio.Event] = None
+        self._pump_task: Optional[asyncio.Task] = None
+        # metrikalar
+        self.max_depth = 0
+        self.retry_after = 0
+        self.stats = {p: {"sent": 0, "wait_total": 0.0, "wait_max": 0.0} for p in (PRIO_USER, PRIO_BULK)}
+
+    @property
+    def depth(self) -> int:
+        return len(self._heap)
+
+    def _interval(self, chat_id: Any) -> float:
+        try:
+            return self.chat_interval if int(chat_id) > 0 else self.group_interval
+        except (TypeError, ValueError):
+            return self.group_interval     # @kanal_nomi
+
+    def _reserve_chat_slot(self, chat_id: Any, now: float) -> float:
+        if len(self._chat_next) > 50_000:
+            self._chat_next = {c: t for c, t in self._chat_next.items() if t > now}
+            self._chat_sent = {c: t for c, t in self._chat_sent.items() if t + self.group_interval > now}
+        at = max(now, self._chat_next.get(chat_id, 0.0))
+        self._chat_next[chat_id] = at + self._interval(chat_id)
+        return at
+
+    async def acquire(self, chat_id: Any, prio: int) -> None:
+        loop = asyncio.get_event_loop()
+        t0 = time.monotonic()
+        if chat_id is not None:
+            at = self._reserve_chat_slot(chat_id, t0)
+            if at > t0:
+                await asyncio.sleep(at - t0)
+
+        fut = loop.create_future()
+        heapq.heappush(self._heap, (prio, next(self._seq), fut))
+        self.max_depth = max(self.max_depth, len(self._heap))
+        if self._pump_task is None or self._pump_task.done():
+            self._wakeup = asyncio.Event()
+            self._pump_task = loop.create_task(self._pump())
+        self._wakeup.set()
+        await fut
+
+        if chat_id is not None:
+            # umumiy navbatda kutib qolgan bo‘lsa, shu chatga oldingi yuborishdan oraliq saqlanadi
+            gap = self._chat_sent.get(chat_id, 0.0) + self._interval(chat_id) - time.monotonic()
+            if gap > 0:
+                await asyncio.sleep(gap)
+            self._chat_sent[chat_id] = time.monotonic()
+
+        waited = time.monotonic() - t0
+        st = self.stats[prio]
+        st["sent"] += 1
+        st["wait_total"] += waited
+        st["wait_max"] = max(st["wait_max"], waited)
+
+    def backoff(self, chat_id: Any, seconds: float) -> None:
+        self.retry_after += 1
+        until = time.monotonic() + seconds
+        if chat_id is None:
+            self.paused_until = max(self.paused_until, until)
+        else:
+            self._chat_next[chat_id] = max(self._chat_next.get(chat_id, 0.0), until)
+
+    async def _pump(self) -> None:
+        while True:
+            if not self._heap:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+            now = time.monotonic()
+            if self.paused_until > now:
+                await asyncio.sleep(self.paused_until - now)
+                continue
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                continue
+            _, _, fut = heapq.heappop(self._heap)
+            if fut.done():
+                continue
+            self.tokens -= 1
+            fut.set_result(None)
+
+    def summary(self) -> str:
+        parts = []
+        for name, p in (("user", PRIO_USER), ("kanal", PRIO_BULK)):
+            st = self.stats[p]
+            avg = st["wait_total"] / st["sent"] * 1000 if st["sent"] else 0.0
+            parts.append(f"{name}: {st['sent']} ta, o‘rt. {avg:.0f} ms, maks. {st['wait_max'] * 1000:.0f} ms")
+        return (
+            f"navbat {self.depth} (maks. {self.max_depth}), 429: {self.retry_after}\n"
+            + "\n".join(f"   {p}" for p in parts)
+        )
+
+send_scheduler = SendScheduler(SEND_GLOBAL_RATE, SEND_BURST, SEND_CHAT_INTERVAL, SEND_GROUP_INTERVAL)
+
+class ScheduledBot(Bot):
+    async def _timed_request(self, method, data=None, files=None, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return await super().request(method, data, files, **kwargs)
+        except Exception:
+            metrics.api_errors[method] += 1
+            raise
+        finally:
+            metrics.observe(metrics.api, method, time.perf_counter() - t0)
+
+    async def request(self, method, data=None, files=None, **kwargs):
+        if method not in _PACED_METHODS:
+            return await self._timed_request(method, data, files, **kwargs)
+
+        chat_id = (data or {}).get("chat_id")
+        prio = PRIO_BULK if str(chat_id) in _BULK_CHATS else send_priority.get()
+        attempt = 0
+        while True:
+            await send_scheduler.acquire(chat_id, prio)
+            try:
+                return await self._timed_request(method, data, files, **kwargs)
+            except RetryAfter as e:
+                send_scheduler.backoff(chat_id, e.timeout)
+                attempt += 1
+                # fayl yuklash (backup) qayta yuborilmaydi — oqim allaqachon o‘qilgan
+                if files or attempt > SEND_MAX_RETRIES:
+                    raise
+
+    async def get_updates(self, *args, **kwargs):
+        # update navbati to‘lgan bo‘lsa yangisi so‘ralmaydi — ular Telegram'da kutib turadi
+        await update_pool.wait_room()
+        return await super().get_updates(*args, **kwargs)
+
+_BULK_CHATS = {str(CHANNEL2_ID)}
+
+# ================== UPDATE NAVBATI ==================
+# aiogram har bir update uchun chegarasiz task ochadi, bitta userning ketma-ket update'lari
+# (AddSeries, EditFlow) esa aralashib ketishi mumkin. Bu yerda update'lar user id bo‘yicha
+# UPDATE_WORKERS ta shardga bo‘linadi: shard ichida navbat bilan, shardlar o‘zaro parallel.
+# Navbat to‘lsa polling yangi update so‘ramaydi, webhook esa Telegram'ga javobni kechiktiradi.
+_UPDATE_KINDS = ("message", "callback_query", "inline_query", "chat_member")
+
+def _update_key(update: types.Update) -> Tuple[int, str]:
+    if update.chat_member:
+        return update.chat_member.new_chat_member.user.id, "chat_member"
+    for kind in _UPDATE_KINDS[:3]:
+        obj = getattr(update, kind)
+        if obj is not None:
+            return (obj.from_user.id if obj.from_user else update.update_id), kind
+    return update.update_id, "other"
+
+class UpdatePool:
+    def __init__(self, workers: int, queue_size: int) -> None:
+        self.workers = workers
+        self.per_shard = max(1, queue_size // max(workers, 1))
+        self.queues: List[asyncio.Queue] = []
+        self.tasks: List[asyncio.Task] = []
+        self._room: Optional[asyncio.Event] = None
+        self._blocked = 0
+        self.full = 0           # navbat to‘lib, yuboruvchi kutgan holatlar
+
+    @property
+    def enabled(self) -> bool:
+        return self.workers > 0
+
+    @property
+    def depth(self) -> int:
+        return sum(q.qsize() for q in self.queues)
+
+    @property
+    def capacity(self) -> int:
+        return self.per_shard * self.workers
+
+    def _start(self, dispatcher: Dispatcher) -> None:
+        loop = asyncio.get_event_loop()
+        self._room = asyncio.Event()
+        self._room.set()
+        self.queues = [asyncio.Queue(self.per_shard) for _ in range(self.workers)]
+        self.tasks = [loop.create_task(self._worker(dispatcher, q)) for q in self.queues]
+
+    async def submit(self, dispatcher: Dispatcher, update: types.Update,
+                     want_result: bool = False) -> Optional[asyncio.Future]:
+        if not self.tasks:
+            self._start(dispatcher)
+        user_id, kind = _update_key(update)
+        q = self.queues[user_id % self.workers]
+        fut = asyncio.get_event_loop().create_future() if want_result else None
+        item = (time.perf_counter(), kind, update, fut)
+        if not q.full():
+            q.put_nowait(item)
+            return fut
+        self.full += 1
+        self._blocked += 1
+        self._room.clear()
+        try:
+            await q.put(item)
+        finally:
+            self._blocked -= 1
+            if not self._blocked:
+                self._room.set()
+        return fut
+
+    async def wait_room(self) -> None:
+        if self._room is not None:
+            await self._room.wait()
+
+    async def _worker(self, dispatcher: Dispatcher, q: asyncio.Queue) -> None:
+        while True:
+            t0, kind, update, fut = await q.get()
+            metrics.observe(metrics.update_wait, kind, time.perf_counter() - t0)
+            try:
+                # Har update alohida task (yangi context) ichida: aiogram StateFilter FSM holatini
+                # ContextVar'da keshlaydi, umumiy contextda oldingi update'ning holati qolib ketadi.
+                # Task kutib turiladi, shuning uchun shard ichidagi tartib o‘zgarmaydi.
+                results = await asyncio.get_event_loop().create_task(dispatcher.updates_handler.notify(update))
+            except Exception as e:
+                metrics.counters["update_errors"] += 1
+                if fut is not None:
+                    if not fut.done():
+                        fut.set_exception(e)    # webhook: xato so‘rov handleriga qaytadi
+                else:
+                    logging.exception("Update %s ishlanmadi", update.update_id)
+                continue
+            finally:
+                q.task_done()
+            if fut is not None:
+                if not fut.done():
+                    fut.set_result(results)
+                continue
+            # polling: webhook uslubidagi javoblar (AnswerCallbackQuery ...) API orqali yuboriladi
+            for responses in results:
+                for response in responses or ():
+                    if isinstance(response, BaseResponse):
+                        await response.execute_response(dispatcher.bot)
+
+    async def drain(self, timeout: float) -> None:
+        if self.queues:
+            await asyncio.wait([asyncio.ensure_future(q.join()) for q in self.queues], timeout=timeout)
+
+update_pool = UpdatePool(UPDATE_WORKERS, UPDATE_QUEUE_SIZE)
+
+class PooledDispatcher(Dispatcher):
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._feed_lock = asyncio.Lock()
+
+    async def _process_polling_updates(self, updates, fast: bool = True):
+        if not update_pool.enabled:
+            return await super()._process_polling_updates(updates, fast)
+        # polling har paket uchun alohida task ochadi; lock paketlar tartibini saqlaydi
+        async with self._feed_lock:
+            for update in updates:
+                await update_pool.submit(self, update)
+
 # ================== BOT ==================
-bot = Bot(token=BOT_TOKEN, parse_mode="HTML")
-dp = Dispatcher(bot, storage=MemoryStorage())
+bot = ScheduledBot(
+    token=BOT_TOKEN,
+    parse_mode="HTML",
+    server=TelegramAPIServer.from_base(TELEGRAM_API_URL) if TELEGRAM_API_URL else TELEGRAM_PRODUCTION,
+)
+dp = PooledDispatcher(bot, storage=MemoryStorage())
+
+class MetricsMiddleware(BaseMiddleware):
+    # process_* handler tanlangandan keyin, post_process_* u tugagach chaqiriladi
+    @staticmethod
+    def _start(data: dict) -> None:
+        data["_metrics_handler"] = current_handler.get().__name__
+        data["_metrics_t0"] = time.perf_counter()
+
+    @staticmethod
+    def _stop(data: dict) -> None:
+        name = data.get("_metrics_handler")
+        if name:
+            metrics.observe(metrics.handlers, name, time.perf_counter() - data["_metrics_t0"])
+
+    async def on_process_message(self, message, data):
+        self._start(data)
+
+    async def on_post_process_message(self, message, results, data):
+        self._stop(data)
+
+    async def on_process_callback_query(self, call, data):
+        self._start(data)
+
+    async def on_post_process_callback_query(self, call, results, data):
+        self._stop(data)
+
+    async def on_process_inline_query(self, query, data):
+        self._start(data)
+
+    async def on_post_process_inline_query(self, query, results, data):
+        self._stop(data)
+
+    async def on_process_chat_member(self, update, data):
+        self._start(data)
+
+    async def on_post_process_chat_member(self, update, results, data):
+        self._stop(data)
+
+dp.middleware.setup(MetricsMiddleware())
 
 # ================== XOTIRA ==================
 # Yakuniy talab:
 # - Yakka film: tugma 1 marta ishlasin (bosilgandan keyin eskirsin)
 # - Serial: epizod tugmalari xohlagancha ishlasin
-last_movie_request: Dict[int, str] = {}     # {user_id: code}
-last_watch_token: Dict[int, str] = {}       # {user_id: token}
+#
+# Film tugmasi: watch2_<kod>_<token>, token = base64url(muddat 4B + nonce 4B + HMAC 10B) — 24 belgi.
+# HMAC kod, user_id, muddat va nonce'ni bog‘laydi: tugmani boshqa user/kod bilan ishlatib bo‘lmaydi.
+# Userlar bo‘yicha hech narsa saqlanmaydi; faqat ishlatilgan tokenlar (HMAC baytlari bo‘yicha —
+# bir xil baytlarning boshqa yozilishi yangi kalit bo‘lmasin) muddati tugaguncha eslab qolinadi.
+_redeemed_tokens: Dict[bytes, int] = {}     # {mac: expires_at}
+
+def _watch_mac(code: str, user_id: int, exp: int, nonce: bytes) -> bytes:
+    msg = f"{code}:{user_id}:{exp}:{nonce.hex()}".encode()
+    return hmac.new(WATCH_TOKEN_SECRET.encode(), msg, hashlib.sha256).digest()[:10]
+
+def make_watch_token(code: str, user_id: int) -> str:
+    exp = int(time.time()) + WATCH_TOKEN_TTL
+    nonce = os.urandom(4)
+    raw = exp.to_bytes(4, "big") + nonce + _watch_mac(code, user_id, exp, nonce)
+    return base64.urlsafe_b64encode(raw).decode()
+
+def check_watch_token(code: str, user_id: int, token: str) -> Optional[Tuple[int, bytes]]:
+    # To‘g‘ri, muddati o‘tmagan va hali ishlatilmagan bo‘lsa (muddat, kalit) qaytaradi
+    try:
+        raw = base64.b64decode(token.encode(), altchars=b"-_", validate=True)
+    except (ValueError, TypeError):
+        return None
+    # faqat kanonik yozuv (padding/ortiqcha bitlar boshqacha bo‘lsa ham decode bo‘ladi)
+    if len(raw) != 18 or base64.urlsafe_b64encode(raw).decode() != token:
+        return None
+    exp, nonce, mac = int.from_bytes(raw[:4], "big"), raw[4:8], raw[8:]
+    if exp < time.time() or mac in _redeemed_tokens:
+        return None
+    if not hmac.compare_digest(mac, _watch_mac(code, user_id, exp, nonce)):
+        return None
+    return exp, mac
+
+def redeem_watch_token(key: bytes, exp: int) -> None:
+    _redeemed_tokens[key] = exp
+    if len(_redeemed_tokens) > WATCH_REDEEMED_MAX:
+        now = time.time()
+        for t in [t for t, e in _redeemed_tokens.items() if e < now]:
+            del _redeemed_tokens[t]
+        while len(_redeemed_tokens) > WATCH_REDEEMED_MAX:
+            del _redeemed_tokens[next(iter(_redeemed_tokens))]
 
 # ================== JSON (atomic) ==================
+def _json_default(obj: Any) -> Any:
+    if isinstance(obj, Mapping):     # CompactItem / CompactEpisodes
+        return dict(obj)
+    raise TypeError(f"{type(obj).__name__} JSON emas")
+
 def _atomic_write_json(path: str, data: Any) -> None:
     tmp = f"{path}.tmp"
     with open(tmp, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+        json.dump(data, f, ensure_ascii=False, indent=2, default=_json_default)
     os.replace(tmp, path)
 
-def load_db() -> Dict[str, Any]:
-    if not os.path.exists(MOVIES_FILE):
+# Fayl/DB yozish event loop'ni to‘xtatmasligi uchun thread pool'da, bittadan bajariladi
+_io_lock = asyncio.Lock()
+
+async def run_io(fn, *args) -> Any:
+    async with _io_lock:
+        return await asyncio.get_event_loop().run_in_executor(None, fn, *args)
+
+# Faqat CPU ishi (indeks qurish, serializatsiya): _io_lock ushlanmaydi — fayl yozishlar kutib qolmasin
+async def run_cpu(fn, *args) -> Any:
+    return await asyncio.get_event_loop().run_in_executor(None, fn, *args)
+
+def _read_db_file(path: Optional[str] = None) -> Dict[str, Any]:
+    path = path or MOVIES_FILE
+    if not os.path.exists(path):
         return {}
     try:
-        with open(MOVIES_FILE, "r", encoding="utf-8") as f:
-            db = json.load(f)
+        with open(path, "r", encoding="utf-8") as f:
+            # CATALOG_COMPACT: itemlar parse paytida ixchamlanadi (xom dict'lar to‘planib qolmaydi)
+            db = json.load(f, object_hook=_compact_hook if CATALOG_COMPACT else None)
     except Exception:
         return {}
 
@@ -69,7 +597,7 @@ def load_db() -> Dict[str, Any]:
     # yangi botda item["type"] mavjud
     fixed: Dict[str, Any] = {}
     for code, item in (db or {}).items():
-        if not isinstance(item, dict):
+        if not isinstance(item, Mapping):
             continue
         if "type" not in item:
             # eski format -> movie
@@ -85,8 +613,796 @@ def load_db() -> Dict[str, Any]:
             fixed[code] = item
     return fixed
 
-def save_db(data: Dict[str, Any]) -> None:
-    _atomic_write_json(MOVIES_FILE, data)
+# ================== SQLITE (ixtiyoriy) ==================
+# MOVIES_BACKEND=sqlite bo‘lsa katalog MOVIES_DB_FILE da (WAL) saqlanadi:
+# har bir o‘zgarish faqat o‘z qatorini yozadi, butun katalogni emas.
+_SQL_SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    code            TEXT PRIMARY KEY,
+    type            TEXT NOT NULL,
+    photo_file_id   TEXT,
+    caption         TEXT NOT NULL DEFAULT '',
+    video_file_id   TEXT,
+    video_unique_id TEXT,
+    channel_msg_id  INTEGER
+);
+CREATE TABLE IF NOT EXISTS episodes (
+    code            TEXT NOT NULL REFERENCES items(code) ON DELETE CASCADE,
+    ep              INTEGER NOT NULL,
+    video_file_id   TEXT,
+    video_unique_id TEXT,
+    title           TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (code, ep)
+);
+CREATE INDEX IF NOT EXISTS items_video_uid ON items(video_unique_id);
+CREATE INDEX IF NOT EXISTS episodes_video_uid ON episodes(video_unique_id);
+"""
+
+_sql: Optional[sqlite3.Connection] = None
+
+def _sql_open(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA foreign_keys=ON")
+    conn.executescript(_SQL_SCHEMA)
+    return conn
+
+def _sql_conn() -> sqlite3.Connection:
+    global _sql
+    if _sql is None:
+        fresh = not os.path.exists(MOVIES_DB_FILE)
+        _sql = _sql_open(MOVIES_DB_FILE)
+        if fresh and (os.path.exists(MOVIES_FILE) or os.path.exists(MOVIES_JOURNAL)):
+            # birinchi ishga tushishda movies.json + jurnal avtomatik ko‘chiriladi
+            _sql_replace_all(_sql, _read_json_storage(MOVIES_FILE, MOVIES_JOURNAL)[0])
+    return _sql
+
+def _sql_item_row(code: str, item: Dict[str, Any]) -> Tuple[Any, ...]:
+    prefix = "post" if item.get("type") == "movie" else "poster"
+    return (
+        code,
+        item.get("type"),
+        item.get(f"{prefix}_file_id"),
+        item.get(f"{prefix}_caption") or "",
+        item.get("video_file_id"),
+        item.get("video_unique_id"),
+        item.get("channel_msg_id"),
+    )
+
+def _sql_episode_row(code: str, ep_num: int, ep: Dict[str, Any]) -> Tuple[Any, ...]:
+    return (code, ep_num, ep.get("video_file_id"), ep.get("video_unique_id"), ep.get("title") or "")
+
+_SQL_UPSERT_ITEM = (
+    "INSERT INTO items (code, type, photo_file_id, caption, video_file_id, video_unique_id, channel_msg_id) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?) "
+    "ON CONFLICT(code) DO UPDATE SET type=excluded.type, photo_file_id=excluded.photo_file_id, "
+    "caption=excluded.caption, video_file_id=excluded.video_file_id, "
+    "video_unique_id=excluded.video_unique_id, channel_msg_id=excluded.channel_msg_id"
+)
+_SQL_UPSERT_EPISODE = (
+    "INSERT OR REPLACE INTO episodes (code, ep, video_file_id, video_unique_id, title) VALUES (?, ?, ?, ?, ?)"
+)
+
+def _sql_put_item(conn: sqlite3.Connection, code: str, item: Dict[str, Any], with_episodes: bool = True) -> None:
+    conn.execute(_SQL_UPSERT_ITEM, _sql_item_row(code, item))
+    if with_episodes and item.get("type") == "series":
+        conn.execute("DELETE FROM episodes WHERE code = ?", (code,))
+        conn.executemany(_SQL_UPSERT_EPISODE, [
+            _sql_episode_row(code, int(k), epv)
+            for k, epv in (item.get("episodes", {}) or {}).items()
+            if str(k).isdigit() and isinstance(epv, dict)
+        ])
+
+_SQL_FIELD_COLUMNS = {
+    "post_file_id": "photo_file_id",
+    "poster_file_id": "photo_file_id",
+    "post_caption": "caption",
+    "poster_caption": "caption",
+    "video_file_id": "video_file_id",
+    "video_unique_id": "video_unique_id",
+    "channel_msg_id": "channel_msg_id",
+}
+
+def _sql_apply(conn: sqlite3.Connection, e: Dict[str, Any]) -> None:
+    # Jurnal yozuvini (catalog_* dan) qatorlarga qo‘llash
+    op, code = e["op"], e["code"]
+    if op == "delete":
+        conn.execute("DELETE FROM items WHERE code = ?", (code,))
+    elif op == "delete_episode":
+        conn.execute("DELETE FROM episodes WHERE code = ? AND ep = ?", (code, e["ep"]))
+    elif op in ("add_episode", "replace_episode"):
+        conn.execute(_SQL_UPSERT_EPISODE, _sql_episode_row(code, e["ep"], e["data"]))
+    elif "item" in e:
+        _sql_put_item(conn, code, e["item"])
+    elif e.get("fields"):
+        cols = [(_SQL_FIELD_COLUMNS[k], v) for k, v in e["fields"].items() if k in _SQL_FIELD_COLUMNS]
+        if cols:
+            sets = ", ".join(f"{c} = ?" for c, _ in cols)
+            conn.execute(f"UPDATE items SET {sets} WHERE code = ?", (*[v for _, v in cols], code))
+
+def _sql_replace_all(conn: sqlite3.Connection, db: Dict[str, Any]) -> None:
+    with conn:
+        conn.execute("DELETE FROM episodes")
+        conn.execute("DELETE FROM items")
+        for code, item in db.items():
+            _sql_put_item(conn, code, item)
+
+def _sql_load(conn: sqlite3.Connection) -> Dict[str, Any]:
+    db: Dict[str, Any] = {}
+    for code, typ, photo, caption, vfid, vuid, ch_msg_id in conn.execute(
+        "SELECT code, type, photo_file_id, caption, video_file_id, video_unique_id, channel_msg_id FROM items"
+    ):
+        if typ == "movie":
+            db[code] = {
+                "type": "movie",
+                "post_file_id": photo,
+                "post_caption": caption,
+                "video_file_id": vfid,
+                "video_unique_id": vuid,
+                "channel_msg_id": ch_msg_id,
+            }
+        else:
+            db[code] = {
+                "type": typ,
+                "poster_file_id": photo,
+                "poster_caption": caption,
+                "episodes": {},
+                "channel_msg_id": ch_msg_id,
+            }
+    for code, ep_num, vfid, vuid, title in conn.execute(
+        "SELECT code, ep, video_file_id, video_unique_id, title FROM episodes ORDER BY code, ep"
+    ):
+        if code in db:
+            db[code]["episodes"][str(ep_num)] = {"video_file_id": vfid, "video_unique_id": vuid, "title": title}
+    return db
+
+def migrate_json_to_sqlite(json_path: str, db_path: str, journal_path: str = "") -> int:
+    # Bir martalik: movies.json (eski formatdagi itemlar ham) + jurnal -> SQLite
+    data = _read_json_storage(json_path, journal_path)[0]
+    conn = _sql_open(db_path)
+    try:
+        _sql_replace_all(conn, data)
+    finally:
+        conn.close()
+    return len(data)
+
+# ================== JURNAL (JSON backend) ==================
+# Har bir admin o‘zgarishi movies.journal.jsonl ga bitta qator bo‘lib qo‘shiladi.
+# Ishga tushishda: movies.json (snapshot) + jurnal qayta o‘ynaladi.
+# Jurnal uzaysa fon rejimida yangi snapshotga yig‘iladi (compaction) va tozalanadi.
+# Barcha amallar idempotent: snapshot yozilib, jurnal tozalanmay qolsa ham natija bir xil.
+_journal_entries = 0    # oxirgi snapshotdan keyingi yozuvlar
+_compacting = False
+
+def _read_journal(path: str) -> List[Dict[str, Any]]:
+    if not os.path.exists(path):
+        return []
+    out: List[Dict[str, Any]] = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                out.append(json.loads(line))
+            except ValueError:
+                # yarim yozilgan oxirgi qator (crash)
+                continue
+    return out
+
+def _apply_op(db: Dict[str, Any], e: Dict[str, Any]) -> None:
+    op, code = e.get("op"), e.get("code")
+    if op == "delete":
+        db.pop(code, None)
+    elif "item" in e:
+        db[code] = e["item"]
+    elif code not in db:
+        return
+    elif "fields" in e:
+        db[code] = {**db[code], **e["fields"]}
+    elif op in ("add_episode", "replace_episode", "delete_episode"):
+        eps = dict(db[code].get("episodes", {}) or {})
+        if op == "delete_episode":
+            eps.pop(str(e["ep"]), None)
+        else:
+            eps[str(e["ep"])] = e["data"]
+        db[code] = {**db[code], "episodes": eps}
+
+def _read_json_storage(path: str, journal_path: str) -> Tuple[Dict[str, Any], int]:
+    """Snapshot + jurnal qayta o‘ynaladi; (katalog, jurnal yozuvlari soni)."""
+    db = _read_db_file(path)
+    journal = _read_journal(journal_path) if journal_path else []
+    for e in journal:
+        _apply_op(db, e)
+    return db, len(journal)
+
+# ================== IXCHAM ITEMLAR (CATALOG_COMPACT) ==================
+# Katta katalogda dict-of-dicts o‘rniga: item = __slots__ obyekt (faqat o‘qish uchun Mapping),
+# type teglari intern qilingan, captionlar esa anonim vaqtinchalik faylda (mmap) —
+# xotirada faqat (offset, uzunlik) soni turadi, matn kerak bo‘lganda o‘qiladi.
+# Qism: (video_file_id, video_unique_id, title) tuple, o‘qilganda odatiy dict qaytadi.
+# Itemlar joyida o‘zgartirilmaydi (copy-on-write), shuning uchun faqat o‘qish yetarli.
+class _CaptionStore:
+    """Append-only: tahrir qilingan caption yangi joyga yoziladi, eski joy bo‘shatilmaydi.
+
+    Indeks qurish executor thread'ida o‘qiydi, event loop esa shu paytda yozadi: fayl pozitsiyasi
+    va mmap almashtirish lock ostida. Eski mapping yangisi ochilgach yopiladi.
+    """
+
+    def __init__(self) -> None:
+        self._file = tempfile.TemporaryFile()
+        self._size = 0
+        self._mm: Optional[mmap.mmap] = None
+        self._mapped = 0
+        self._lock = threading.Lock()
+
+    def put(self, text: Optional[str]) -> int:
+        if not text:
+            return 0
+        data = text.encode("utf-8")
+        with self._lock:
+            off = self._size
+            self._file.seek(off)
+            self._file.write(data)
+            self._size += len(data)
+        return (off << 24) | len(data)
+
+    def get(self, ref: int) -> str:
+        if not ref:
+            return ""
+        off, n = ref >> 24, ref & 0xFFFFFF
+        with self._lock:
+            if off + n > self._mapped:
+                self._file.flush()
+                old, self._mm = self._mm, mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+                self._mapped = self._size
+                if old is not None:
+                    old.close()
+            data = self._mm[off:off + n]
+        return data.decode("utf-8")
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+_captions: Optional[_CaptionStore] = None
+_CAPTION_KEYS = frozenset(("post_caption", "poster_caption"))
+_EP_KEYS = ("video_file_id", "video_unique_id", "title")
+
+class CompactEpisodes(Mapping):
+    __slots__ = ("_eps",)
+
+    def __init__(self, eps: Mapping) -> None:
+        packed = {}
+        for k, v in eps.items():
+            if isinstance(v, dict) and v.keys() == set(_EP_KEYS):
+                packed[sys.intern(str(k))] = (v["video_file_id"], v["video_unique_id"], sys.intern(v["title"] or ""))
+            else:
+                packed[sys.intern(str(k))] = v     # noodatiy qism: o‘zi turadi
+        self._eps = packed
+
+    def __getitem__(self, key: str) -> Any:
+        v = self._eps[key]
+        return dict(zip(_EP_KEYS, v)) if isinstance(v, tuple) else v
+
+    def __iter__(self):
+        return iter(self._eps)
+
+    def __len__(self) -> int:
+        return len(self._eps)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._eps
+
+class CompactItem(Mapping):
+    __slots__ = ("type", "post_file_id", "post_caption", "poster_file_id", "poster_caption",
+                 "video_file_id", "video_unique_id", "channel_msg_id", "episodes", "_extra")
+    _FIELDS = frozenset(__slots__) - {"_extra"}
+
+    def __init__(self, item: Mapping) -> None:
+        extra = None
+        for key, value in item.items():
+            if key not in self._FIELDS:
+                extra = extra or {}
+                extra[key] = value
+            elif key in _CAPTION_KEYS:
+                object.__setattr__(self, key, _caption_store().put(value))
+            elif key == "type":
+                object.__setattr__(self, key, sys.intern(value) if isinstance(value, str) else value)
+            elif key == "episodes" and isinstance(value, Mapping):
+                object.__setattr__(self, key, value if isinstance(value, CompactEpisodes) else CompactEpisodes(value))
+            else:
+                object.__setattr__(self, key, value)
+        object.__setattr__(self, "_extra", extra)
+
+    def __setattr__(self, key: str, value: Any) -> None:
+        raise TypeError("CompactItem o‘zgarmaydi: {**item, ...} bilan yangisini yarating")
+
+    def __getitem__(self, key: str) -> Any:
+        if key in self._FIELDS:
+            try:
+                value = object.__getattribute__(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+            return _captions.get(value) if key in _CAPTION_KEYS else value
+        if self._extra and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __iter__(self):
+        for key in self.__slots__[:-1]:
+            if hasattr(self, key):
+                yield key
+        if self._extra:
+            yield from self._extra
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __contains__(self, key: object) -> bool:
+        if key in self._FIELDS:
+            return hasattr(self, key)
+        return bool(self._extra) and key in self._extra
+
+def _caption_store() -> _CaptionStore:
+    global _captions
+    if _captions is None:
+        _captions = _CaptionStore()
+    return _captions
+
+def _compact_hook(obj: Dict[str, Any]) -> Any:
+    # json object_hook: ichki obyektlar oldin keladi; "type" faqat item darajasida bor
+    return CompactItem(obj) if "type" in obj else obj
+
+def _store_item(item: Mapping) -> Mapping:
+    """Katalogga qo‘yiladigan ko‘rinish: CATALOG_COMPACT bo‘lsa CompactItem, aks holda o‘zi."""
+    if CATALOG_COMPACT and not isinstance(item, CompactItem):
+        return CompactItem(item)
+    return item
+
+# ================== KATALOG (xotirada) ==================
+# Katalog bir marta o‘qiladi va xotirada turadi; so‘rovlar faqat shu nusxani o‘qiydi (diskka tegmaydi).
+# Tashqi o‘zgarishni fon task (watch_catalog) har CATALOG_RECHECK_INTERVAL sekundda executorda tekshiradi:
+# JSON: movies.json yoki jurnal mtime/size o‘zgarsa (qo‘lda tahrir, backup tiklash) qayta o‘qiladi.
+# SQLite: boshqa ulanish yozgan bo‘lsa (PRAGMA data_version) qayta o‘qiladi.
+_catalog: Dict[str, Any] = {}
+_catalog_sig: Any = None
+_catalog_loaded = False
+_pending_writes = 0     # yozilayotgan paytda diskdan qayta o‘qilmaydi
+
+def _file_sig(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+def _storage_sig() -> Any:
+    if MOVIES_BACKEND == "sqlite":
+        return _sql_conn().execute("PRAGMA data_version").fetchone()[0]
+    return _file_sig(MOVIES_FILE), _file_sig(MOVIES_JOURNAL)
+
+def _read_storage() -> Dict[str, Any]:
+    global _journal_entries
+    metrics.counters["storage_load"] += 1
+    if MOVIES_BACKEND == "sqlite":
+        return _sql_load(_sql_conn())
+    db, _journal_entries = _read_json_storage(MOVIES_FILE, MOVIES_JOURNAL)
+    return db
+
+def _read_catalog() -> Tuple[Any, Dict[str, Any]]:
+    # executor thread'ida: sig o‘qishdan oldin olinadi, oradagi yozuv keyingi tekshiruvda ko‘rinadi
+    sig = _storage_sig()
+    db = _read_storage()
+    if CATALOG_COMPACT:
+        db = {sys.intern(code): _store_item(item) for code, item in db.items()}
+    return sig, db
+
+def _install_catalog(sig: Any, db: Dict[str, Any]) -> None:
+    global _catalog, _catalog_sig, _catalog_loaded, _code_pool
+    _catalog = db
+    _catalog_sig = sig
+    _catalog_loaded = True
+    _rebuild_video_index(_catalog)
+    invalidate_episode_cache()
+    invalidate_search_index()
+    _code_pool = None
+
+def load_db() -> Dict[str, Any]:
+    # Birinchi chaqiruvda (startup, skriptlar) sinxron o‘qiladi; keyin faqat xotiradagi katalog
+    if not _catalog_loaded:
+        _install_catalog(*_read_catalog())
+    return _catalog
+
+async def reload_catalog_if_changed() -> bool:
+    if not _catalog_loaded or _pending_writes:
+        return False
+    sig = await run_io(_storage_sig)
+    if sig == _catalog_sig or _pending_writes:
+        return False
+    old_sig = _catalog_sig
+    new_sig, db = await run_io(_read_catalog)
+    # o‘qish paytida bot o‘zi yozgan bo‘lsa, o‘qilgan nusxa eskirgan bo‘lishi mumkin — keyingi safar
+    if _pending_writes or _catalog_sig != old_sig:
+        return False
+    _install_catalog(new_sig, db)
+    return True
+
+async def watch_catalog() -> None:
+    while True:
+        await asyncio.sleep(CATALOG_RECHECK_INTERVAL)
+        try:
+            await reload_catalog_if_changed()
+        except Exception:
+            logging.exception("Katalogni qayta o‘qib bo‘lmadi")
+
+def get_item(code: str) -> Optional[Dict[str, Any]]:
+    return load_db().get(code)
+
+# Quyidagilar executor thread'ida ishlaydi va yangi storage sig qaytaradi.
+# Ularga faqat snapshot beriladi: katalog itemlari copy-on-write, joyida o‘zgarmaydi.
+def _write_all(snapshot: Dict[str, Any]) -> Any:
+    metrics.counters["storage_save_snapshot"] += 1
+    if MOVIES_BACKEND == "sqlite":
+        _sql_replace_all(_sql_conn(), snapshot)
+    else:
+        _atomic_write_json(MOVIES_FILE, snapshot)
+        # snapshot ichida jurnaldagi hamma narsa bor
+        if os.path.exists(MOVIES_JOURNAL):
+            os.remove(MOVIES_JOURNAL)
+    return _storage_sig()
+
+def _write_batch(entries: List[Dict[str, Any]]) -> Any:
+    # SQLite: bitta tranzaksiya. JSON: jurnalga bitta yozish.
+    metrics.counters["storage_save_batch"] += 1
+    if MOVIES_BACKEND == "sqlite":
+        conn = _sql_conn()
+        with conn:
+            for e in entries:
+                _sql_apply(conn, e)
+    else:
+        with open(MOVIES_JOURNAL, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(e, ensure_ascii=False) + "\n" for e in entries))
+    return _storage_sig()
+
+# ================== YOZUVCHI (yagona) ==================
+# Katalogning barcha diskka yozishlari bitta fon task orqali, kelgan tartibda bajariladi.
+# O‘zgarish xotiraga darhol qo‘llanadi, yozuv navbatga tushadi; navbatdagi hamma yozuvlar
+# bitta disk yozishiga birlashtiriladi (100 ta qism ketma-ket kelsa ham).
+# catalog_* funksiyalari yozuv diskka tushgunicha kutadi.
+_write_queue: List[Tuple[Optional[Dict[str, Any]], Optional[asyncio.Future]]] = []    # None = compaction
+_write_wakeup = asyncio.Event()
+_writer_task: Optional[asyncio.Task] = None
+
+def _enqueue_write(entry: Optional[Dict[str, Any]], wait: bool = True) -> Optional[asyncio.Future]:
+    global _writer_task, _pending_writes
+    loop = asyncio.get_event_loop()
+    if _writer_task is None or _writer_task.done():
+        _writer_task = loop.create_task(_catalog_writer())
+    fut = loop.create_future() if wait else None
+    _write_queue.append((entry, fut))
+    _pending_writes += 1
+    _write_wakeup.set()
+    return fut
+
+async def _catalog_writer() -> None:
+    global _catalog_sig, _pending_writes, _journal_entries
+    while True:
+        await _write_wakeup.wait()
+        _write_wakeup.clear()
+        while _write_queue:
+            batch = _write_queue[:]
+            del _write_queue[:]
+            entries = [e for e, _ in batch if e is not None]
+            try:
+                if len(entries) < len(batch) and MOVIES_BACKEND != "sqlite":
+                    # compaction: snapshotda navbatdagi hamma o‘zgarishlar bor, jurnalga yozish shart emas
+                    _journal_entries = 0
+                    _catalog_sig = await run_io(_write_all, dict(_catalog))
+                elif entries:
+                    _catalog_sig = await run_io(_write_batch, entries)
+                error = None
+            except Exception as e:
+                error = e
+            finally:
+                _pending_writes -= len(batch)
+            for _, fut in batch:
+                if fut is not None and not fut.done():
+                    if error is None:
+                        fut.set_result(None)
+                    else:
+                        fut.set_exception(error)
+
+async def _persist_change(entry: Dict[str, Any]) -> None:
+    global _journal_entries
+    fut = _enqueue_write(entry)
+    if MOVIES_BACKEND != "sqlite":
+        _journal_entries += 1
+        if _journal_entries >= JOURNAL_COMPACT_EVERY and not _compacting:
+            _request_compaction()
+    await fut
+
+def _request_compaction() -> Optional[asyncio.Future]:
+    global _compacting
+    _compacting = True
+    fut = _enqueue_write(None)
+    fut.add_done_callback(_compaction_done)
+    return fut
+
+def _compaction_done(fut: asyncio.Future) -> None:
+    global _compacting
+    _compacting = False
+    if not fut.cancelled():
+        fut.exception()     # "never retrieved" ogohlantirishi chiqmasin
+
+async def compact_catalog() -> None:
+    # Jurnalni yangi movies.json snapshotga yig‘ish
+    if MOVIES_BACKEND == "sqlite" or not _journal_entries:
+        return
+    await asyncio.shield(_request_compaction())
+
+# ================== VIDEO INDEKS ==================
+# video_unique_id -> (kod, qism). Kino uchun qism = None.
+# Katalog o‘qilganda qayta quriladi, har bir o‘zgarishda yangilanadi.
+_video_index: Dict[str, Tuple[str, Optional[int]]] = {}
+
+def _item_videos(item: Dict[str, Any]) -> List[Tuple[str, Optional[int]]]:
+    if item.get("type") == "movie":
+        vid = item.get("video_unique_id")
+        return [(vid, None)] if vid else []
+    out: List[Tuple[str, Optional[int]]] = []
+    for k, epv in (item.get("episodes", {}) or {}).items():
+        if isinstance(epv, dict) and epv.get("video_unique_id") and str(k).isdigit():
+            out.append((epv["video_unique_id"], int(k)))
+    return out
+
+def _index_item(code: str, item: Dict[str, Any]) -> None:
+    for vid, ep in _item_videos(item):
+        _video_index[vid] = (code, ep)
+
+def _unindex_item(code: str, item: Dict[str, Any]) -> None:
+    for vid, _ in _item_videos(item):
+        if _video_index.get(vid, ("",))[0] == code:
+            del _video_index[vid]
+
+def _rebuild_video_index(db: Dict[str, Any]) -> None:
+    _video_index.clear()
+    for code, item in db.items():
+        _index_item(code, item)
+
+def find_video_owner(video_unique_id: str) -> Optional[Tuple[str, Optional[int]]]:
+    load_db()
+    return _video_index.get(video_unique_id)
+
+# ================== MATN QIDIRUV INDEKSI ==================
+# Caption va qism nomlari so‘zlarga bo‘linadi (kirill -> lotin, apostroflarsiz, kichik harf).
+# Ikki qavatli indeks: trigram -> so‘zlar (lug‘at), so‘z -> kodlar. Xato yozilgan so‘z avval
+# lug‘atdan trigram o‘xshashligi bo‘yicha topiladi, keyin shu so‘zlar kodlari ballanadi.
+# on_startup'da thread pool'da (run_cpu) quriladi, keyin katalog o‘zgarishlarida shu kod uchun yangilanadi.
+# Katalog qayta o‘qilsa (tashqi o‘zgarish) eski indeks ishlab turadi, yangisi fonda quriladi.
+_TRANSLIT = str.maketrans({
+    "а": "a", "б": "b", "в": "v", "г": "g", "ғ": "g", "д": "d", "е": "e", "ё": "yo", "ж": "j",
+    "з": "z", "и": "i", "й": "y", "к": "k", "қ": "q", "л": "l", "м": "m", "н": "n", "о": "o",
+    "п": "p", "р": "r", "с": "s", "т": "t", "у": "u", "ў": "o", "ф": "f", "х": "x", "ҳ": "h",
+    "ц": "s", "ч": "ch", "ш": "sh", "щ": "sh", "ъ": None, "ы": "i", "ь": None, "э": "e",
+    "ю": "yu", "я": "ya",
+    "'": None, "`": None, "‘": None, "’": None, "ʻ": None, "ʼ": None,
+})
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+_search_ready = False     # indeks bor (eskirgan bo‘lishi mumkin)
+_search_stale = False     # katalog qayta o‘qildi: fonda qayta qurish kerak
+_search_task: Optional[asyncio.Task] = None
+_search_touched: Optional[set] = None    # fonda qurish paytida o‘zgargan kodlar
+_search_docs: Dict[str, set] = {}     # kod -> so‘zlar
+_search_words: Dict[str, set] = {}    # so‘z -> kodlar
+_search_grams: Dict[str, set] = {}    # trigram -> so‘zlar
+
+# Inline so‘rovlar natijasi: {normallashgan so‘rov: [kodlar]} (LRU), katalog o‘zgarsa tozalanadi
+_inline_cache: "OrderedDict[str, List[str]]" = OrderedDict()
+
+def normalize_words(text: str) -> List[str]:
+    text = CODE_LINE_RE.sub(" ", text or "").lower().translate(_TRANSLIT)
+    return [w for w in _WORD_RE.findall(text) if len(w) > 1]
+
+def _word_grams(word: str) -> set:
+    w = f" {word} "
+    return {w[i:i + 3] for i in range(len(w) - 2)}
+
+def _item_search_text(item: Dict[str, Any]) -> str:
+    parts = [item.get("poster_caption") if item.get("type") == "series" else item.get("post_caption")]
+    for epv in (item.get("episodes", {}) or {}).values():
+        if isinstance(epv, dict):
+            parts.append(epv.get("title"))
+    return "\n".join(p for p in parts if p)
+
+def _search_unindex(code: str) -> None:
+    for w in _search_docs.pop(code, ()):
+        codes = _search_words.get(w)
+        if codes is None:
+            continue
+        codes.discard(code)
+        if not codes:
+            del _search_words[w]
+            for g in _word_grams(w):
+                ws = _search_grams.get(g)
+                if ws is not None:
+                    ws.discard(w)
+                    if not ws:
+                        del _search_grams[g]
+
+def _search_index(code: str, item: Dict[str, Any], tables: Optional[Tuple[dict, dict, dict]] = None) -> None:
+    docs, words_idx, grams = tables or (_search_docs, _search_words, _search_grams)
+    words = set(normalize_words(_item_search_text(item)))
+    docs[code] = words
+    for w in words:
+        codes = words_idx.get(w)
+        if codes is None:
+            codes = words_idx[w] = set()
+            for g in _word_grams(w):
+                grams.setdefault(g, set()).add(w)
+        codes.add(code)
+
+def search_reindex(code: str) -> None:
+    _inline_cache.clear()
+    if _search_touched is not None:
+        _search_touched.add(code)    # fondagi qurilishdan keyin qayta indekslanadi
+    if not _search_ready:
+        return
+    _search_unindex(code)
+    item = _catalog.get(code)
+    if item is not None:
+        _search_index(code, item)
+
+def invalidate_search_index() -> None:
+    # load_db thread'da ham chaqiriladi: bu yerda faqat belgilanadi, qurish event loop'dan boshlanadi
+    global _search_stale
+    _search_stale = True
+    _inline_cache.clear()
+
+def _build_search_tables(db: Dict[str, Any]) -> Tuple[dict, dict, dict]:
+    tables: Tuple[dict, dict, dict] = ({}, {}, {})
+    for code, item in db.items():
+        _search_index(code, item, tables)
+    return tables
+
+def _install_search_tables(tables: Tuple[dict, dict, dict]) -> None:
+    global _search_docs, _search_words, _search_grams, _search_ready
+    _search_docs, _search_words, _search_grams = tables
+    _search_ready = True
+    _inline_cache.clear()
+
+def _search_build() -> None:
+    """Sinxron qurish: event loop yo‘q joyda (skriptlar, benchmarklar)."""
+    global _search_stale
+    db = load_db()
+    if _search_ready and not _search_stale:
+        return
+    _search_stale = False
+    _install_search_tables(_build_search_tables(db))
+
+async def rebuild_search_index() -> None:
+    global _search_stale, _search_touched
+    _search_stale = False
+    _search_touched = set()
+    try:
+        tables = await run_cpu(_build_search_tables, dict(load_db()))
+    finally:
+        touched, _search_touched = _search_touched, None
+    _install_search_tables(tables)
+    for code in touched:
+        search_reindex(code)
+
+def _ensure_search_index() -> None:
+    global _search_task
+    load_db()
+    if _search_ready and not _search_stale:
+        return
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return _search_build()
+    if _search_task is None or _search_task.done():
+        _search_task = loop.create_task(rebuild_search_index())
+
+def _similar_words(word: str, limit: int = 30) -> List[Tuple[str, float]]:
+    qg = _word_grams(word)
+    shared: Counter = Counter()
+    for g in qg:
+        shared.update(_search_grams.get(g, ()))
+    # Dice >= t bo‘lishi uchun umumiy trigramlar kamida t*|q|/(2-t) ta bo‘lishi shart
+    min_shared = math.ceil(SEARCH_MIN_SIMILARITY * len(qg) / (2 - SEARCH_MIN_SIMILARITY))
+    out = []
+    for w, n in shared.items():
+        if n < min_shared:
+            continue
+        sim = 2.0 * n / (len(qg) + len(w))     # Dice: " so‘z " trigramlari soni = len(so‘z)
+        if sim >= SEARCH_MIN_SIMILARITY:
+            out.append((w, min(sim, 1.0)))
+    return heapq.nlargest(limit, out, key=lambda x: x[1])
+
+def search_titles(query: str, limit: int = SEARCH_RESULTS) -> List[Tuple[str, float]]:
+    """Nom/caption bo‘yicha eng mos kodlar: [(kod, ball), ...]. Indeks qurilayotgan bo‘lsa — eskisi bo‘yicha."""
+    _ensure_search_index()
+    total_docs = max(len(_search_docs), 1)
+    scores: Dict[str, float] = {}
+    for qw in dict.fromkeys(normalize_words(query)):
+        best: Dict[str, float] = {}
+        for w, sim in _similar_words(qw):
+            codes = _search_words[w]
+            weight = sim * math.log(1 + total_docs / len(codes))    # kam uchraydigan so‘z qimmatroq
+            for code in codes:
+                if weight > best.get(code, 0.0):
+                    best[code] = weight
+        for code, sc in best.items():
+            scores[code] = scores.get(code, 0.0) + sc
+    return heapq.nlargest(limit, scores.items(), key=lambda x: x[1])
+
+# ================== KATALOG O‘ZGARISHLARI ==================
+# Admin o‘zgarishlari faqat shu funksiyalar orqali: xotira, indeks va saqlash joyi birga yangilanadi.
+# Itemlar joyida o‘zgartirilmaydi (copy-on-write) — fon thread'idagi yozish eski snapshotni ko‘radi.
+# Jurnal amallari: add_movie, add_series, add_episode, replace_episode, delete_episode,
+# edit_post, edit_video, publish, delete.
+def _journal_entry(op: str, code: str, **payload: Any) -> Dict[str, Any]:
+    return {"op": op, "code": code, "ts": int(time.time()), **payload}
+
+async def catalog_put(code: str, item: Dict[str, Any]) -> None:
+    db = load_db()
+    old = db.get(code)
+    if old is not None:
+        _unindex_item(code, old)
+    db[code] = _store_item(item)
+    _index_item(code, item)
+    invalidate_episode_cache(code)
+    search_reindex(code)
+    _reserved_codes.pop(code, None)
+    await _persist_change(_journal_entry(f"add_{item.get('type')}", code, item=item))
+
+async def catalog_update(code: str, op: str, **fields: Any) -> None:
+    db = load_db()
+    item = db[code]
+    _unindex_item(code, item)
+    item = {**item, **fields}
+    db[code] = _store_item(item)
+    _index_item(code, item)
+    search_reindex(code)
+    await _persist_change(_journal_entry(op, code, fields=fields))
+
+async def catalog_delete(code: str) -> Optional[Dict[str, Any]]:
+    db = load_db()
+    item = db.pop(code, None)
+    if item is not None:
+        _unindex_item(code, item)
+        invalidate_episode_cache(code)
+        search_reindex(code)
+        await _persist_change(_journal_entry("delete", code))
+    return item
+
+async def catalog_set_episode(code: str, ep_num: int, ep: Dict[str, Any]) -> None:
+    db = load_db()
+    item = db[code]
+    eps = dict(item.get("episodes", {}) or {})
+    old = eps.get(str(ep_num))
+    if isinstance(old, dict) and _video_index.get(old.get("video_unique_id")) == (code, ep_num):
+        del _video_index[old["video_unique_id"]]
+    eps[str(ep_num)] = ep
+    db[code] = _store_item({**item, "episodes": eps})
+    if ep.get("video_unique_id"):
+        _video_index[ep["video_unique_id"]] = (code, ep_num)
+    invalidate_episode_cache(code)
+    search_reindex(code)
+    op = "replace_episode" if old is not None else "add_episode"
+    await _persist_change(_journal_entry(op, code, ep=ep_num, data=ep))
+
+async def catalog_delete_episode(code: str, ep_num: int) -> None:
+    db = load_db()
+    item = db[code]
+    eps = dict(item.get("episodes", {}) or {})
+    old = eps.pop(str(ep_num), None)
+    if isinstance(old, dict) and _video_index.get(old.get("video_unique_id")) == (code, ep_num):
+        del _video_index[old["video_unique_id"]]
+    db[code] = _store_item({**item, "episodes": eps})
+    invalidate_episode_cache(code)
+    search_reindex(code)
+    await _persist_change(_journal_entry("delete_episode", code, ep=ep_num))
 
 # ================== STATISTIKA ==================
 def load_stats() -> Dict[str, Any]:
@@ -109,41 +1425,428 @@ def load_stats() -> Dict[str, Any]:
 def save_stats(data: Dict[str, Any]) -> None:
     _atomic_write_json(STATS_FILE, data)
 
-def update_stats(user_id: int) -> None:
-    stats = load_stats()
-    today = datetime.now().strftime("%Y-%m-%d")
+# Statistika xotirada yuradi, faylga vaqti-vaqti bilan (yoki N ta so‘rovdan keyin) yoziladi
+class _Stats:
+    def __init__(self) -> None:
+        self.loaded = False
+        self.users: set = set()
+        self.total_requests = 0
+        self.today = {"date": datetime.now().strftime("%Y-%m-%d"), "count": 0}
+        self.pending = 0    # faylga yozilmagan so‘rovlar
+        self.flushing = False
+
+_stats = _Stats()
+
+def _stats_engine() -> _Stats:
+    if not _stats.loaded:
+        data = load_stats()
+        _stats.users = set(data.get("users", []))
+        _stats.total_requests = int(data.get("total_requests", 0))
+        _stats.today = dict(data.get("today") or _stats.today)
+        _stats.loaded = True
+    return _stats
+
+def _stats_snapshot() -> Dict[str, Any]:
+    st = _stats_engine()
+    return {
+        "users": list(st.users),
+        "total_requests": st.total_requests,
+        "today": dict(st.today),
+    }
+
+def flush_stats() -> None:
+    if not _stats.loaded or not _stats.pending:
+        return
+    save_stats(_stats_snapshot())
+    _stats.pending = 0
 
-    if user_id not in stats["users"]:
-        stats["users"].append(user_id)
+async def flush_stats_async() -> None:
+    if not _stats.loaded or not _stats.pending or _stats.flushing:
+        return
+    snapshot = _stats_snapshot()
+    _stats.pending = 0
+    _stats.flushing = True
+    try:
+        await run_io(save_stats, snapshot)
+    except Exception:
+        _stats.pending += 1     # keyingi safar qayta yoziladi
+    finally:
+        _stats.flushing = False
+
+def update_stats(user_id: int, code: Optional[str] = None) -> None:
+    st = _stats_engine()
+    today = datetime.now().strftime("%Y-%m-%d")
+    record_event(A_HOUR, datetime.now().hour)
+    if code:
+        record_event(A_VIEW, code)
 
-    stats["total_requests"] += 1
+    st.users.add(user_id)
+    st.total_requests += 1
 
-    if stats["today"]["date"] != today:
-        stats["today"] = {"date": today, "count": 1}
+    if st.today.get("date") != today:
+        st.today = {"date": today, "count": 1}
     else:
-        stats["today"]["count"] += 1
+        st.today["count"] += 1
 
-    save_stats(stats)
+    st.pending += 1
+    if st.pending >= STATS_FLUSH_EVERY and not st.flushing:
+        asyncio.ensure_future(flush_stats_async())
+
+def forget_users(user_ids: List[int]) -> None:
+    # Botni bloklagan / o‘chirilgan akkauntlar ro‘yxatdan chiqariladi
+    st = _stats_engine()
+    for uid in user_ids:
+        st.users.discard(uid)
+    st.pending += 1
+
+async def periodic_flush() -> None:
+    while True:
+        await asyncio.sleep(STATS_FLUSH_INTERVAL)
+        await flush_stats_async()
+        await flush_members_async()
+        await flush_analytics_async()
+
+# ================== ANALITIKA ==================
+# Kunlik yig‘indilar xotirada: {kun: Counter{(tur, kalit, qism): soni}}.
+# Faylga faqat oxirgi flushdan keyingi o‘sishlar qo‘shiladi (append-only, 19 bayt/yozuv);
+# ishga tushishda va kun almashganda bir xil kalitlar qo‘shib chiqiladi, eski kunlar tashlanadi
+# va fayl qayta yoziladi.
+A_HOUR, A_VIEW, A_PLAY = 0, 1, 2     # kalit: soat (0-23) / kod (str); qism: faqat A_PLAY (film = 0)
+_A_REC = struct.Struct("<IBQHI")      # kun (YYYYMMDD), tur, kalit, qism, soni
+# Faylda kod "1" + kod soni bo‘lib yoziladi ("0123" -> 10123): boshidagi nollar yo‘qolmaydi.
+# Fayl boshidagi shu yozuv 2-versiya belgisi; 1-versiyada kalit int(kod) edi.
+_A_VERSION = 2
+_A_HEADER = (0, 0xFF, _A_VERSION, 0, 0)
+_A_CODE_RE = re.compile(r"[0-9]{1,18}")    # "1" + kod 8 baytga sig‘ishi kerak
+
+class _Analytics:
+    def __init__(self) -> None:
+        self.loaded = False
+        self.days: Dict[int, Counter] = {}
+        self.pending: Counter = Counter()    # (kun, tur, kalit, qism) -> faylga yozilmagan
+        self.flushing = False
+        self.rolled_day = 0                  # fayl oxirgi marta qayta yozilgan kun
+
+_analytics = _Analytics()
+
+def _day_key(d: Optional[datetime] = None) -> int:
+    d = d or datetime.now()
+    return d.year * 10000 + d.month * 100 + d.day
+
+def _read_analytics(path: str) -> Dict[int, Counter]:
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return {}
+    usable = len(data) - len(data) % _A_REC.size     # chala yozilgan oxirgi yozuv tashlanadi
+    records = _A_REC.iter_unpack(memoryview(data)[:usable])
+    version = 1
+    if usable and _A_REC.unpack_from(data) == _A_HEADER:
+        version = _A_VERSION
+        next(records)
+    days: Dict[int, Counter] = {}
+    for day, kind, key, ep, n in records:
+        if kind != A_HOUR:
+            key = str(key)[1:] if version == _A_VERSION else str(key)
+        days.setdefault(day, Counter())[(kind, key, ep)] += n
+    return days
+
+def _pack_analytics(rows) -> bytes:
+    return b"".join(_A_REC.pack(day, kind, key if kind == A_HOUR else int("1" + key), ep, n)
+                    for (day, kind, key, ep), n in rows)
+
+def _write_analytics_rollup(days: Dict[int, Counter]) -> None:
+    tmp = ANALYTICS_FILE + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(_A_REC.pack(*_A_HEADER))
+        for day in sorted(days):
+            f.write(_pack_analytics(((day, *k), n) for k, n in days[day].items()))
+    os.replace(tmp, ANALYTICS_FILE)
+
+def _append_analytics(rows: List[Tuple[Tuple[int, int, int, int], int]]) -> None:
+    with open(ANALYTICS_FILE, "ab") as f:
+        f.write(_pack_analytics(rows))
+
+def _prune_analytics_days(a: _Analytics) -> None:
+    cutoff = _day_key(datetime.now() - timedelta(days=ANALYTICS_RETENTION_DAYS))
+    for day in [d for d in a.days if d < cutoff]:
+        del a.days[day]
+
+def _analytics_engine() -> _Analytics:
+    if not _analytics.loaded:
+        _analytics.days = _read_analytics(ANALYTICS_FILE)
+        _prune_analytics_days(_analytics)
+        _write_analytics_rollup(_analytics.days)
+        _analytics.rolled_day = _day_key()
+        _analytics.loaded = True
+    return _analytics
+
+def record_event(kind: int, key: Any, ep: int = 0) -> None:
+    if kind != A_HOUR and not _A_CODE_RE.fullmatch(str(key)):
+        return
+    a = _analytics_engine()
+    day = _day_key()
+    counts = a.days.get(day)
+    if counts is None:
+        counts = a.days[day] = Counter()
+        _prune_analytics_days(a)
+    k = (kind, key if kind == A_HOUR else str(key), min(int(ep), 0xFFFF))
+    counts[k] += 1
+    a.pending[(day, *k)] += 1
+
+def record_play(code: str, ep: Optional[int] = None) -> None:
+    record_event(A_PLAY, code, ep or 0)
+
+def flush_analytics() -> None:
+    if not _analytics.loaded or not _analytics.pending:
+        return
+    _append_analytics(list(_analytics.pending.items()))
+    _analytics.pending = Counter()
+
+async def flush_analytics_async() -> None:
+    a = _analytics
+    if not a.loaded or a.flushing:
+        return
+    today = _day_key()
+    if a.rolled_day != today:
+        # kuniga bir marta: eski kunlar tashlanadi, fayl yig‘indilar bilan qayta yoziladi
+        # (pending ham a.days ichida bor — alohida qo‘shilmaydi)
+        _prune_analytics_days(a)
+        snapshot = {day: Counter(counts) for day, counts in a.days.items()}
+        rows = a.pending
+        a.pending = Counter()
+        a.flushing = True
+        try:
+            await run_io(_write_analytics_rollup, snapshot)
+            a.rolled_day = today
+        except Exception:
+            a.pending.update(rows)
+        finally:
+            a.flushing = False
+        return
+    if not a.pending:
+        return
+    rows = list(a.pending.items())
+    a.pending = Counter()
+    a.flushing = True
+    try:
+        await run_io(_append_analytics, rows)
+    except Exception:
+        a.pending.update(dict(rows))     # keyingi safar qayta yoziladi
+    finally:
+        a.flushing = False
+
+def analytics_rollup(days: int = ANALYTICS_WINDOW_DAYS) -> Counter:
+    a = _analytics_engine()
+    since = _day_key(datetime.now() - timedelta(days=days - 1))
+    total: Counter = Counter()
+    for day, counts in a.days.items():
+        if day >= since:
+            total.update(counts)
+    return total
 
 # ================== AVTOKOD ==================
-def generate_unique_code(db: Dict[str, Any]) -> str:
+# Bo‘sh kodlar aralashtirilgan pool'da turadi: ajratish O(1), tasodifiy tartib saqlanadi.
+# Joriy uzunlikdagi kodlar tugasa keyingisiga o‘tiladi (9999 -> 10000...), eski kodlar o‘zgarmaydi.
+# Kod post qabul qilinganda band qilinadi, shuning uchun ikki admin bir xil kod ololmaydi.
+# Admin oqimni bekor qilmay tashlab ketsa, band kod CODE_RESERVE_TTL dan keyin bo‘shaydi;
+# saqlashdan oldin hold_code() kod hali shu adminniki ekanini tekshiradi.
+_code_pool: Optional[List[str]] = None     # None = katalogdan qayta quriladi
+_code_width = CODE_MIN_DIGITS
+_reserved_codes: Dict[str, Tuple[int, float]] = {}     # {kod: (admin id, band qilingan vaqt)}
+
+def _fill_code_pool() -> None:
+    global _code_pool, _code_width
+    used = set(load_db()) | _reserved_codes.keys()
+    width = CODE_MIN_DIGITS
     while True:
-        code = str(random.randint(1000, 9999))
-        if code not in db:
+        free = [c for c in map(str, range(10 ** (width - 1), 10 ** width)) if c not in used]
+        if free:
+            break
+        width += 1
+    random.shuffle(free)
+    _code_pool = free
+    _code_width = width
+
+def _expire_reservations() -> None:
+    cutoff = time.monotonic() - CODE_RESERVE_TTL
+    for code in [c for c, (_, t) in _reserved_codes.items() if t < cutoff]:
+        release_code(code)
+
+def reserve_code(user_id: int) -> str:
+    _expire_reservations()
+    db = load_db()
+    while True:
+        if not _code_pool:
+            _fill_code_pool()
+        code = _code_pool.pop()
+        if code not in db and code not in _reserved_codes:
+            _reserved_codes[code] = (user_id, time.monotonic())
             return code
 
+def hold_code(code: Optional[str], user_id: int) -> str:
+    """FSM'dagi kodni yangilaydi; yo‘q bo‘lsa yoki muddati o‘tib boshqaga berilgan bo‘lsa — yangi kod."""
+    if code is None:
+        return reserve_code(user_id)
+    owner = _reserved_codes.get(code)
+    if (owner is not None and owner[0] != user_id) or (owner is None and code in load_db()):
+        return reserve_code(user_id)
+    _reserved_codes[code] = (user_id, time.monotonic())
+    return code
+
+def release_code(code: Optional[str], user_id: Optional[int] = None) -> None:
+    """Saqlanmay qolgan (bekor qilingan) kodni pool'ga qaytaradi; user_id berilsa — faqat o‘zinikini."""
+    owner = _reserved_codes.get(code)
+    if owner is None or (user_id is not None and owner[0] != user_id):
+        return
+    del _reserved_codes[code]
+    if code not in load_db() and _code_pool is not None and len(code) == _code_width:
+        _code_pool.append(code)
+
 # ================== OBUNA ==================
-async def check_subscription(user_id: int) -> bool:
+_MEMBER_STATUSES = ("member", "administrator", "creator")
+
+# Kanal a'zoligi chat_member update'lari orqali kuzatiladi: {chat_id: {user_id: (a'zomi, vaqt)}}
+# Bu yerga faqat chat_member yozadi; hali ko‘rilmagan user uchun API chaqiriladi va
+# natija TTL keshida (_sub_cache) turadi — bot admin bo‘lmagan kanalda chiqib ketish ham sezilsin.
+# Yozuv SUB_TRACKED_MAX_AGE dan eski bo‘lsa (chiqish update'i o‘tkazib yuborilgan bo‘lishi mumkin)
+# API bilan qayta tekshiriladi: mos kelsa vaqti yangilanadi, zid bo‘lsa yozuv o‘chiriladi.
+_MEMBERS_VERSION = 3    # 1-versiyada API natijalari ham yozilgan: o‘qilmaydi; 2-versiyada vaqt yo‘q
+_members: Dict[int, Dict[int, Tuple[bool, int]]] = {}
+_members_loaded = False
+_members_dirty = False
+
+def _members_store() -> Dict[int, Dict[int, Tuple[bool, int]]]:
+    global _members_loaded
+    if not _members_loaded:
+        _members.clear()
+        try:
+            with open(MEMBERS_FILE, "r", encoding="utf-8") as f:
+                raw = json.load(f)
+            mtime = int(os.path.getmtime(MEMBERS_FILE))
+        except Exception:
+            raw, mtime = {}, 0
+        version = raw.get("v") if isinstance(raw, dict) else None
+        if version not in (2, _MEMBERS_VERSION):
+            raw = {"chats": {}}
+        for chat_id, rec in raw["chats"].items():
+            m = _members.setdefault(int(chat_id), {})
+            for key, ok in (("in", True), ("out", False)):
+                if version == 2:    # vaqt yo‘q: fayl yozilgan vaqt olinadi
+                    m.update((u, (ok, mtime)) for u in rec.get(key, []))
+                else:
+                    m.update((u, (ok, ts)) for u, ts in rec.get(key, []))
+        _members_loaded = True
+    return _members
+
+def _set_member(chat_id: int, user_id: int, is_member: bool) -> None:
+    global _members_dirty
+    _members_store().setdefault(int(chat_id), {})[user_id] = (is_member, int(time.time()))
+    _members_dirty = True
+
+def _touch_member(user_id: int) -> None:
+    # API tasdiqladi: kuzatuv yozuvlari yana SUB_TRACKED_MAX_AGE davomida ishonchli
+    global _members_dirty
+    now = int(time.time())
+    for m in _members_store().values():
+        entry = m.get(user_id)
+        if entry is not None:
+            m[user_id] = (entry[0], now)
+            _members_dirty = True
+
+def _forget_member(user_id: int) -> None:
+    global _members_dirty
+    for m in _members_store().values():
+        if m.pop(user_id, None) is not None:
+            _members_dirty = True
+
+def _members_snapshot() -> Dict[str, Any]:
+    return {"v": _MEMBERS_VERSION, "chats": {
+        str(chat_id): {
+            "in": [[u, ts] for u, (ok, ts) in m.items() if ok],
+            "out": [[u, ts] for u, (ok, ts) in m.items() if not ok],
+        }
+        for chat_id, m in _members.items()
+    }}
+
+def flush_members() -> None:
+    global _members_dirty
+    if not _members_dirty:
+        return
+    _atomic_write_json(MEMBERS_FILE, _members_snapshot())
+    _members_dirty = False
+
+async def flush_members_async() -> None:
+    global _members_dirty
+    if not _members_dirty:
+        return
+    snapshot = _members_snapshot()
+    _members_dirty = False
+    try:
+        await run_io(_atomic_write_json, MEMBERS_FILE, snapshot)
+    except Exception:
+        _members_dirty = True
+
+def _tracked_subscription(user_id: int) -> Tuple[Optional[bool], bool]:
+    """(kuzatilgan natija yoki None, yozuvlar SUB_TRACKED_MAX_AGE dan yangimi)"""
+    store = _members_store()
+    e1 = store.get(FORCE_SUB_1_ID, {}).get(user_id)
+    e2 = store.get(FORCE_SUB_2_ID, {}).get(user_id)
+    if e1 is None or e2 is None:
+        return None, False
+    fresh = min(e1[1], e2[1]) > time.time() - SUB_TRACKED_MAX_AGE
+    return e1[0] and e2[0], fresh
+
+# Natija user bo‘yicha keshlanadi: obuna bo‘lganlar uzoqroq, bo‘lmaganlar qisqa muddat.
+_sub_cache: Dict[int, Tuple[bool, float]] = {}     # {user_id: (ok, expires_at)}
+sub_cache_stats = {"tracked": 0, "hit": 0, "miss": 0}
+
+def _sub_cache_put(user_id: int, ok: bool) -> None:
+    now = time.monotonic()
+    _sub_cache.pop(user_id, None)
+    _sub_cache[user_id] = (ok, now + (SUB_CACHE_TTL_OK if ok else SUB_CACHE_TTL_FAIL))
+    if len(_sub_cache) > SUB_CACHE_MAX:
+        for uid in [u for u, (_, exp) in _sub_cache.items() if exp <= now]:
+            del _sub_cache[uid]
+        while len(_sub_cache) > SUB_CACHE_MAX:
+            del _sub_cache[next(iter(_sub_cache))]
+
+async def check_subscription(user_id: int, force: bool = False) -> bool:
     if not FORCE_SUB_ENABLED:
         return True
+
+    tracked, fresh = _tracked_subscription(user_id)
+    if not force:
+        if tracked is not None and fresh:
+            sub_cache_stats["tracked"] += 1
+            return tracked
+        cached = _sub_cache.get(user_id)
+        if cached and cached[1] > time.monotonic():
+            sub_cache_stats["hit"] += 1
+            return cached[0]
+    sub_cache_stats["miss"] += 1
+
     try:
-        member1 = await bot.get_chat_member(FORCE_SUB_1_ID, user_id)
-        member2 = await bot.get_chat_member(FORCE_SUB_2_ID, user_id)
-        ok1 = member1.status in ("member", "administrator", "creator")
-        ok2 = member2.status in ("member", "administrator", "creator")
-        return ok1 and ok2
+        member1, member2 = await asyncio.gather(
+            bot.get_chat_member(FORCE_SUB_1_ID, user_id),
+            bot.get_chat_member(FORCE_SUB_2_ID, user_id),
+        )
     except Exception:
+        # API xatosi keshlanmaydi
+        metrics.counters["sub_api_error"] += 1
         return False
+    ok1 = member1.status in _MEMBER_STATUSES
+    ok2 = member2.status in _MEMBER_STATUSES
+    if tracked is not None and tracked != (ok1 and ok2):
+        # qayta tekshiruv kuzatuvga zid: o‘tkazib yuborilgan chat_member (bot o‘chiq edi) —
+        # yozuv olib tashlanadi, keyingi tekshiruvlar TTL kesh orqali
+        _forget_member(user_id)
+    elif tracked is not None:
+        _touch_member(user_id)
+    _sub_cache_put(user_id, ok1 and ok2)
+    metrics.counters["sub_api_ok" if ok1 and ok2 else "sub_api_not_member"] += 1
+    return ok1 and ok2
 
 def subscribe_kb():
     kb = types.InlineKeyboardMarkup(row_width=1)
@@ -166,7 +1869,7 @@ def admin_menu():
     kb.row("✏️ Tahrirlash", "🗑 O‘chirish")
     kb.row("🎬 Qidiruv", "📊 Statistika")
     kb.row("📦 Kino backup", "📈 Statistika backup")
-    kb.row("❌ Bekor qilish")
+    kb.row("📣 Xabar tarqatish", "❌ Bekor qilish")
     return kb
 
 def is_admin(uid: int) -> bool:
@@ -191,8 +1894,113 @@ class EditFlow(StatesGroup):
 class DeleteFlow(StatesGroup):
     code = State()
 
+class BroadcastFlow(StatesGroup):
+    message = State()
+    confirm = State()
+
+# ================== MARSHRUTLASH ==================
+# Callback data: "<prefiks>:<qism>:..." (CallbackData). Eski "watch_/watch2_<kod>_<token>"
+# tugmalari "_" bilan tugaydigan prefiks sifatida ro‘yxatga olinadi.
+publish_movie_cb = CallbackData("publish_movie", "code")
+publish_series_cb = CallbackData("publish_series", "code")
+find_cb = CallbackData("find", "code")
+series_private_cb = CallbackData("series_private", "code")
+series_page_cb = CallbackData("series_page", "code", "page")
+series_ep_cb = CallbackData("series_ep", "code", "ep")
+edit_type_cb = CallbackData("edit_type", "kind")
+edit_movie_post_cb = CallbackData("edit_movie_post", "code")
+edit_movie_video_cb = CallbackData("edit_movie_video", "code")
+edit_series_post_cb = CallbackData("edit_series_post", "code")
+series_add_cb = CallbackData("series_add", "code")
+series_replace_cb = CallbackData("series_replace", "code")
+series_del_cb = CallbackData("series_del", "code")
+edit_delete_cb = CallbackData("edit_delete", "code")
+
+class Route:
+    __slots__ = ("handler", "state", "factory", "wants")
+
+    def __init__(self, handler, state, factory: Optional[CallbackData]):
+        self.handler = handler
+        self.state = state.state if isinstance(state, State) else state    # None | "*" | "Group:state"
+        self.factory = factory
+        self.wants = {p for p in inspect.signature(handler).parameters if p in ("state", "callback_data")}
+
+class Router:
+    """
+    aiogram filtrlarni handlerlar bo‘yicha ketma-ket tekshiradi; bu yerda esa bitta
+    callback handler prefiksni lug‘atdan oladi, menyu tugmalari esa aniq matn jadvalidan.
+
+    Tartib: setup() barcha aniq @dp handlerlaridan keyin, nom bo‘yicha qidiruv va fallback'dan
+    oldin chaqiriladi (fayl oxirida). Mos marshrut topilmasa (noma'lum data, holat yoki format
+    mos emas) SkipHandler — update keyingi handlerlarga o‘tadi.
+    """
+
+    def __init__(self) -> None:
+        self.callbacks: Dict[str, Route] = {}
+        self.texts: Dict[str, Route] = {}
+
+    def callback(self, key, state=None):
+        """key: CallbackData (prefiks bo‘yicha), aniq data yoki "_" bilan tugaydigan eski prefiks."""
+        def deco(fn):
+            factory = key if isinstance(key, CallbackData) else None
+            name = factory.prefix if factory else key
+            if name in self.callbacks:
+                raise ValueError(f"callback route takrorlandi: {name}")
+            self.callbacks[name] = Route(fn, state, factory)
+            return fn
+        return deco
+
+    def text(self, *texts: str):
+        """Menyu tugmalari: faqat FSM holati yo‘q paytda (oldingi lambda filtrlar kabi)."""
+        def deco(fn):
+            for t in texts:
+                self.texts[t] = Route(fn, None, None)
+            return fn
+        return deco
+
+    def resolve(self, data: str) -> Optional[Route]:
+        route = self.callbacks.get(data.split(":", 1)[0])
+        if route is None:
+            route = self.callbacks.get(data.split("_", 1)[0] + "_")
+        return route
+
+    @staticmethod
+    async def _call(route: Route, obj, state: FSMContext, callback_data=None):
+        ctx_data.get()["_metrics_handler"] = route.handler.__name__
+        kwargs = {}
+        if "state" in route.wants:
+            kwargs["state"] = state
+        if "callback_data" in route.wants:
+            kwargs["callback_data"] = callback_data
+        return await route.handler(obj, **kwargs)
+
+    async def dispatch_callback(self, call: types.CallbackQuery, state: FSMContext):
+        data = call.data or ""
+        route = self.resolve(data)
+        if route is None:
+            raise SkipHandler()
+        if route.state != "*" and await state.get_state() != route.state:
+            raise SkipHandler()
+        parsed = None
+        if route.factory is not None:
+            try:
+                parsed = route.factory.parse(data)
+            except ValueError:
+                raise SkipHandler() from None
+        return await self._call(route, call, state, parsed)
+
+    async def dispatch_text(self, message: types.Message, state: FSMContext):
+        return await self._call(self.texts[message.text], message, state)
+
+    def setup(self, dispatcher: Dispatcher) -> None:
+        # Menyu matni FSM holatisiz bo‘lsa olinadi; holatdagi matnlar FSM handlerlariga o‘tadi
+        dispatcher.register_message_handler(self.dispatch_text, lambda m: m.text in self.texts)
+        dispatcher.register_callback_query_handler(self.dispatch_callback, state="*")
+
+router = Router()
+
 # ================== HELPERS ==================
-CODE_LINE_RE = re.compile(r"(🆔\s*Kod:\s*([0-9]{4}))", re.IGNORECASE)
+CODE_LINE_RE = re.compile(r"(🆔\s*Kod:\s*([0-9]{4,}))", re.IGNORECASE)
 
 def _ensure_code_line_kept(new_caption: str, old_caption_with_code: str, code: str) -> str:
     # Kanal1 captionida kod bo‘lmaydi, Kanal2’da esa kod saqlanib qolishi shart
@@ -201,16 +2009,19 @@ def _ensure_code_line_kept(new_caption: str, old_caption_with_code: str, code: s
     cleaned = CODE_LINE_RE.sub("", (new_caption or "")).strip()
     return f"{cleaned}\n\n{code_line}".strip() if cleaned else code_line
 
-def _duplicate_video_exists(db: Dict[str, Any], video_unique_id: str) -> bool:
-    for it in db.values():
-        if it.get("type") == "movie":
-            if it.get("video_unique_id") == video_unique_id:
-                return True
-        elif it.get("type") == "series":
-            for epv in (it.get("episodes", {}) or {}).values():
-                if isinstance(epv, dict) and epv.get("video_unique_id") == video_unique_id:
-                    return True
-    return False
+def _owner_where(owner: Tuple[str, Optional[int]]) -> str:
+    code, ep = owner
+    return f"🆔 Kod: {code}" + (f", {ep}-qisim" if ep is not None else "")
+
+def _duplicate_text(owner: Tuple[str, Optional[int]]) -> str:
+    return f"❗ Bu kino borku tog'o\n{_owner_where(owner)}"
+
+async def answer_callback(call: types.CallbackQuery, text: Optional[str] = None, show_alert: Optional[bool] = None):
+    # Webhook rejimida javob Telegram so‘roviga HTTP javobning o‘zida qaytadi (alohida API chaqiruvisiz).
+    # Handler oxirida: return await answer_callback(call, ...)
+    if BOT_MODE == "webhook":
+        return AnswerCallbackQuery(call.id, text=text, show_alert=show_alert)
+    await call.answer(text, show_alert=show_alert)
 
 async def _is_forward_from_base(message: types.Message) -> bool:
     return bool(message.forward_from_chat and int(message.forward_from_chat.id) == int(CHANNEL1_ID))
@@ -247,6 +2058,96 @@ def _sorted_episode_numbers(item: Dict[str, Any]) -> List[int]:
             nums.append(int(k))
     return sorted(nums)
 
+def _format_ranges(nums) -> str:
+    # [1, 2, 3, 5, 7, 8] -> "1–3, 5, 7–8"
+    out: List[str] = []
+    for n in sorted(set(nums)):
+        if out and n == prev + 1:
+            out[-1] = f"{out[-1].split('–')[0]}–{n}"
+        else:
+            out.append(str(n))
+        prev = n
+    return ", ".join(out)
+
+# Serial qo‘shish qoralamasi: {admin_id: _SeriesDraft}. Qismlar shu yerda yig‘iladi va
+# "Ha" bosilganda bitta catalog_put bilan saqlanadi.
+class _SeriesDraft:
+    def __init__(self, chat_id: int, code: str) -> None:
+        self.chat_id = chat_id
+        self.code = code
+        self.episodes: Dict[str, Dict[str, Any]] = {}
+        self.videos: Dict[str, str] = {}      # video_unique_id -> qism (to‘plam ichidagi takror uchun)
+        self.task: Optional[asyncio.Task] = None
+        self.last = 0.0
+        self._reset_report()
+
+    def _reset_report(self) -> None:
+        self.accepted: List[int] = []
+        self.duplicates: List[Tuple[str, Optional[int]]] = []
+        self.no_number = 0
+        self.not_forward = 0
+
+    def add(self, forwarded: bool, parsed: Tuple[Optional[int], str], file_id: str, unique_id: str) -> None:
+        self.last = time.monotonic()
+        ep_num, ep_title = parsed
+        if not forwarded:
+            self.not_forward += 1
+            return
+        if ep_num is None:
+            self.no_number += 1
+            return
+        owner = find_video_owner(unique_id)
+        if owner:
+            self.duplicates.append(owner)
+            return
+        seen = self.videos.get(unique_id)
+        if seen is not None and seen != str(ep_num):
+            self.duplicates.append((self.code, int(seen)))
+            return
+
+        # Qo‘shish jarayonida bir xil qism kelib qolsa ustidan yozib ketadi (sizga qulay)
+        old = self.episodes.get(str(ep_num))
+        if old:
+            self.videos.pop(old["video_unique_id"], None)
+        self.episodes[str(ep_num)] = {
+            "video_file_id": file_id,
+            "video_unique_id": unique_id,
+            "title": (ep_title or "").strip()
+        }
+        self.videos[unique_id] = str(ep_num)
+        self.accepted.append(ep_num)
+
+    def report(self) -> str:
+        lines = []
+        if self.accepted:
+            lines.append(f"✅ Qabul qilindi: <b>{len(self.accepted)} ta</b> ({_format_ranges(self.accepted)})")
+        if self.duplicates:
+            lines.append(f"❗ Bu kino borku tog'o: {len(self.duplicates)} ta")
+            lines.extend(f"   {_owner_where(o)}" for o in self.duplicates[:5])
+        if self.no_number:
+            lines.append(f"❗ Captionida qism raqami yo‘q: {self.no_number} ta\nMasalan: <b>1 Yura davri 3</b>")
+        if self.not_forward:
+            lines.append(f"❗ <b>Kanal1 (baza)</b>dan forward qilinmagan: {self.not_forward} ta")
+        lines.append(f"\n📺 Jami: {len(self.episodes)} ta qism. Tugatish uchun <b>Ha</b> deb yozing.")
+        self._reset_report()
+        return "\n".join(lines)
+
+_series_drafts: Dict[int, _SeriesDraft] = {}
+
+def _drop_series_draft(user_id: int) -> None:
+    draft = _series_drafts.pop(user_id, None)
+    if draft is not None and draft.task is not None:
+        draft.task.cancel()
+
+async def _series_draft_report(user_id: int, draft: _SeriesDraft) -> None:
+    while True:
+        wait = draft.last + EPISODE_BATCH_DELAY - time.monotonic()
+        if wait <= 0:
+            break
+        await asyncio.sleep(wait)
+    if _series_drafts.get(user_id) is draft:
+        await bot.send_message(draft.chat_id, draft.report(), reply_markup=admin_menu())
+
 # ================== INLINE KB ==================
 def movie_watch_kb(code: str, token: str) -> types.InlineKeyboardMarkup:
     kb = types.InlineKeyboardMarkup()
@@ -264,14 +2165,57 @@ def channel_series_kb(code: str) -> types.InlineKeyboardMarkup:
     kb.add(types.InlineKeyboardButton("📺 Barcha qismlari", url=f"https://t.me/{BOT_USERNAME}?start=series_{code}"))
     return kb
 
-def series_eps_kb(code: str, eps: List[int]) -> types.InlineKeyboardMarkup:
+# Serial qismlari: saralangan ro‘yxat va tayyor sahifalar keshlanadi,
+# qism qo‘shilsa/almashsa/o‘chsa shu kod uchun tozalanadi.
+_episode_nums_cache: Dict[str, List[int]] = {}
+_episode_kb_cache: Dict[Tuple[str, int], types.InlineKeyboardMarkup] = {}
+
+def invalidate_episode_cache(code: Optional[str] = None) -> None:
+    if code is None:
+        _episode_nums_cache.clear()
+        _episode_kb_cache.clear()
+        return
+    nums = _episode_nums_cache.pop(code, None)
+    pages = -(-len(nums) // EPISODES_PAGE_SIZE) if nums else 1
+    for page in range(max(pages, 1)):
+        _episode_kb_cache.pop((code, page), None)
+
+def episode_numbers(code: str) -> List[int]:
+    item = get_item(code)
+    nums = _episode_nums_cache.get(code)
+    if nums is None:
+        nums = _sorted_episode_numbers(item) if item else []
+        _episode_nums_cache[code] = nums
+    return nums
+
+def series_eps_kb(code: str, page: int = 0) -> types.InlineKeyboardMarkup:
+    nums = episode_numbers(code)
+    pages = max(1, -(-len(nums) // EPISODES_PAGE_SIZE))
+    page = min(max(page, 0), pages - 1)
+    kb = _episode_kb_cache.get((code, page))
+    if kb is not None:
+        return kb
+
     kb = types.InlineKeyboardMarkup(row_width=5)
-    kb.add(*[types.InlineKeyboardButton(str(n), callback_data=f"series_ep:{code}:{n}") for n in eps])
+    chunk = nums[page * EPISODES_PAGE_SIZE:(page + 1) * EPISODES_PAGE_SIZE]
+    kb.add(*[types.InlineKeyboardButton(str(n), callback_data=series_ep_cb.new(code=code, ep=n)) for n in chunk])
+    if pages > 1:
+        nav = []
+        if page > 0:
+            nav.append(types.InlineKeyboardButton("⬅️", callback_data=series_page_cb.new(code=code, page=page - 1)))
+        nav.append(types.InlineKeyboardButton(f"{page + 1}/{pages}", callback_data="noop"))
+        if page < pages - 1:
+            nav.append(types.InlineKeyboardButton("➡️", callback_data=series_page_cb.new(code=code, page=page + 1)))
+        kb.row(*nav)
+    _episode_kb_cache[(code, page)] = kb
     return kb
 
 # ================== BEKOR (har qanday holatda) ==================
 @dp.message_handler(lambda m: (m.text or "").strip() == "❌ Bekor qilish" or ("bekor" in (m.text or "").lower()), state="*")
 async def cancel_anytime(message: types.Message, state: FSMContext):
+    data = await state.get_data()
+    release_code(data.get("code"), message.from_user.id)     # tahrirlash holatidagi mavjud kodga ta'sir qilmaydi
+    _drop_series_draft(message.from_user.id)
     await state.finish()
     if is_admin(message.from_user.id):
         await message.answer("❎ Bekor qilindi tog'o", reply_markup=admin_menu())
@@ -304,13 +2248,13 @@ async def start_cmd(message: types.Message, state: FSMContext):
         await message.answer("🎬 Kino kodini yuboring", reply_markup=user_menu())
 
 # ================== QIDIRUV ==================
-@dp.message_handler(lambda m: m.text == "🎬 Qidiruv")
+@router.text("🎬 Qidiruv")
 async def search_btn(message: types.Message):
     kb = admin_menu() if is_admin(message.from_user.id) else user_menu()
-    await message.answer("🔎 Kino kodini yuboring", reply_markup=kb)
+    await message.answer("🔎 Kino kodini yoki nomini yuboring", reply_markup=kb)
 
 # ================== KINO QO‘SHISH (YAKKA) ==================
-@dp.message_handler(lambda m: m.text == "➕ Kino qo‘shish")
+@router.text("➕ Kino qo‘shish")
 async def add_movie_btn(message: types.Message):
     if message.from_user.id not in ADMINS:
         await message.answer(
@@ -324,8 +2268,8 @@ async def add_movie_btn(message: types.Message):
 
 @dp.message_handler(content_types=types.ContentType.PHOTO, state=AddMovie.post)
 async def add_post(message: types.Message, state: FSMContext):
-    db = load_db()
-    code = generate_unique_code(db)
+    data = await state.get_data()
+    code = hold_code(data.get("code"), message.from_user.id)     # rasm qayta yuborilsa kod o‘zgarmaydi
 
     await state.update_data(
         code=code,
@@ -338,29 +2282,30 @@ async def add_post(message: types.Message, state: FSMContext):
 
 @dp.message_handler(content_types=types.ContentType.VIDEO, state=AddMovie.video)
 async def add_video(message: types.Message, state: FSMContext):
-    db = load_db()
+    data = await state.get_data()
+    code = data["code"]
 
-    if _duplicate_video_exists(db, message.video.file_unique_id):
-        await message.answer("❗ Bu kino borku tog'o", reply_markup=admin_menu())
+    owner = find_video_owner(message.video.file_unique_id)
+    if owner:
+        await message.answer(_duplicate_text(owner), reply_markup=admin_menu())
+        release_code(code, message.from_user.id)
         await state.finish()
         return
 
-    data = await state.get_data()
-    code = data["code"]
+    code = hold_code(code, message.from_user.id)
 
-    db[code] = {
+    await catalog_put(code, {
         "type": "movie",
         "post_file_id": data["post_file_id"],
         "post_caption": data["post_caption"],
         "video_file_id": message.video.file_id,
         "video_unique_id": message.video.file_unique_id,
         "channel_msg_id": None
-    }
-    save_db(db)
+    })
 
     kb = types.InlineKeyboardMarkup()
     kb.add(
-        types.InlineKeyboardButton("✅ Kanalga jo'nataymi", callback_data=f"publish_movie:{code}"),
+        types.InlineKeyboardButton("✅ Kanalga jo'nataymi", callback_data=publish_movie_cb.new(code=code)),
         types.InlineKeyboardButton("❌ Yo jo'natmayinmi?", callback_data="cancel_send")
     )
 
@@ -368,7 +2313,7 @@ async def add_video(message: types.Message, state: FSMContext):
     await state.finish()
 
 # ================== SERIAL QO‘SHISH ==================
-@dp.message_handler(lambda m: m.text == "➕ Serial qo‘shish")
+@router.text("➕ Serial qo‘shish")
 async def add_series_btn(message: types.Message):
     if not is_admin(message.from_user.id):
         await message.answer(
@@ -382,15 +2327,16 @@ async def add_series_btn(message: types.Message):
 
 @dp.message_handler(content_types=types.ContentType.PHOTO, state=AddSeries.poster)
 async def add_series_poster(message: types.Message, state: FSMContext):
-    db = load_db()
-    code = generate_unique_code(db)
+    data = await state.get_data()
+    code = hold_code(data.get("code"), message.from_user.id)
 
     await state.update_data(
         code=code,
         poster_file_id=message.photo[-1].file_id,
-        poster_caption=message.caption or "",
-        episodes={}
+        poster_caption=message.caption or ""
     )
+    _drop_series_draft(message.from_user.id)
+    _series_drafts[message.from_user.id] = _SeriesDraft(message.chat.id, code)
 
     await message.answer(
         f"🆔 <b>Kino kodi avtomatik berildi:</b> {code}\n\n"
@@ -403,62 +2349,54 @@ async def add_series_poster(message: types.Message, state: FSMContext):
 
 @dp.message_handler(lambda m: (m.text or "").strip().lower() == "ha", state=AddSeries.episodes)
 async def add_series_finish(message: types.Message, state: FSMContext):
-    data = await state.get_data()
-    episodes = data.get("episodes", {})
+    draft = _series_drafts.get(message.from_user.id)
+    episodes = draft.episodes if draft else {}
 
     if not episodes:
         await message.answer("❗ Hech bo‘lmasa bitta qism qo‘shing.", reply_markup=admin_menu())
         return
 
-    db = load_db()
-    code = data["code"]
+    _drop_series_draft(message.from_user.id)
+    data = await state.get_data()
+    code = hold_code(data["code"], message.from_user.id)
 
-    db[code] = {
+    await catalog_put(code, {
         "type": "series",
         "poster_file_id": data["poster_file_id"],
         "poster_caption": data["poster_caption"],
         "episodes": episodes,
         "channel_msg_id": None
-    }
-    save_db(db)
+    })
 
     kb = types.InlineKeyboardMarkup()
     kb.add(
-        types.InlineKeyboardButton("✅ Kanalga jo'nataymi", callback_data=f"publish_series:{code}"),
+        types.InlineKeyboardButton("✅ Kanalga jo'nataymi", callback_data=publish_series_cb.new(code=code)),
         types.InlineKeyboardButton("❌ Yo jo'natmayinmi?", callback_data="cancel_send")
     )
 
-    await message.answer(f"✅ Kino saqlandi\n🆔 Kod: {code}\n\nKanalga yuboraymi?", reply_markup=kb)
+    await message.answer(
+        f"✅ Kino saqlandi\n🆔 Kod: {code}\n📺 Qismlar: {len(episodes)} ta ({_format_ranges(map(int, episodes))})\n\n"
+        "Kanalga yuboraymi?",
+        reply_markup=kb
+    )
     await state.finish()
 
 @dp.message_handler(content_types=types.ContentType.VIDEO, state=AddSeries.episodes)
 async def add_series_episode(message: types.Message, state: FSMContext):
-    if not await _is_forward_from_base(message):
-        await message.answer("❗ Iltimos, <b>Kanal1 (baza)</b>dan forward qiling.", reply_markup=admin_menu())
-        return
-
-    ep_num, ep_title = _parse_episode_caption(message.caption or "")
-    if ep_num is None:
-        await message.answer("❗ Video captionida qism raqami yo‘q.\nMasalan: <b>1 Yura davri 3</b>", reply_markup=admin_menu())
-        return
-
-    db = load_db()
-    if _duplicate_video_exists(db, message.video.file_unique_id):
-        await message.answer("❗ Bu kino borku tog'o", reply_markup=admin_menu())
-        return
-
-    data = await state.get_data()
-    episodes: Dict[str, Any] = data.get("episodes", {})
-
-    # Qo‘shish jarayonida bir xil qism kelib qolsa ustidan yozib ketadi (sizga qulay)
-    episodes[str(ep_num)] = {
-        "video_file_id": message.video.file_id,
-        "video_unique_id": message.video.file_unique_id,
-        "title": (ep_title or "").strip()
-    }
-
-    await state.update_data(episodes=episodes)
-    await message.answer(f"✅ Qabul qilindi: <b>{ep_num}-qisim</b>", reply_markup=admin_menu())
+    # Har bir forward faqat xotiradagi qoralamaga tushadi (FSM/diskka emas);
+    # albom yoki ketma-ket forwardlar uchun jimlikdan keyin bitta hisobot yuboriladi.
+    draft = _series_drafts.get(message.from_user.id)
+    if draft is None:
+        data = await state.get_data()
+        draft = _series_drafts[message.from_user.id] = _SeriesDraft(message.chat.id, data["code"])
+    draft.add(
+        await _is_forward_from_base(message),
+        _parse_episode_caption(message.caption or ""),
+        message.video.file_id,
+        message.video.file_unique_id,
+    )
+    if draft.task is None or draft.task.done():
+        draft.task = asyncio.get_event_loop().create_task(_series_draft_report(message.from_user.id, draft))
 
 @dp.message_handler(state=AddSeries.episodes, content_types=types.ContentType.TEXT)
 async def add_series_text_in_episodes(message: types.Message, state: FSMContext):
@@ -469,48 +2407,42 @@ async def add_series_text_in_episodes(message: types.Message, state: FSMContext)
     )
 
 # ================== KANALGA YUBORISH ==================
-@dp.callback_query_handler(lambda c: c.data == "cancel_send")
+@router.callback("cancel_send")
 async def cancel_send(call: types.CallbackQuery):
     await call.message.edit_text("❎ Bekor qilindi")
-    await call.answer()
+    return await answer_callback(call)
 
-@dp.callback_query_handler(lambda c: c.data.startswith("publish_movie:"))
-async def publish_movie(call: types.CallbackQuery):
-    code = call.data.split(":", 1)[1]
-    db = load_db()
-    item = db.get(code)
+@router.callback(publish_movie_cb)
+async def publish_movie(call: types.CallbackQuery, callback_data: dict):
+    code = callback_data["code"]
+    item = get_item(code)
 
     if not item or item.get("type") != "movie":
-        await call.answer("❌ Topilmadi", show_alert=True)
-        return
+        return await answer_callback(call, "❌ Topilmadi", show_alert=True)
 
     caption = f"{(item.get('post_caption') or '').strip()}\n\n🆔 Kod: {code}".strip()
     msg = await bot.send_photo(CHANNEL2_ID, item["post_file_id"], caption=caption, reply_markup=channel_movie_kb(code))
-    item["channel_msg_id"] = msg.message_id
-    db[code] = item
-    save_db(db)
+    if get_item(code) is not None:
+        await catalog_update(code, "publish", channel_msg_id=msg.message_id)
 
     await call.message.edit_text("🚀 Kanalga keeetti tog'o")
-    await call.answer()
+    return await answer_callback(call)
 
-@dp.callback_query_handler(lambda c: c.data.startswith("publish_series:"))
-async def publish_series(call: types.CallbackQuery):
-    code = call.data.split(":", 1)[1]
-    db = load_db()
-    item = db.get(code)
+@router.callback(publish_series_cb)
+async def publish_series(call: types.CallbackQuery, callback_data: dict):
+    code = callback_data["code"]
+    item = get_item(code)
 
     if not item or item.get("type") != "series":
-        await call.answer("❌ Topilmadi", show_alert=True)
-        return
+        return await answer_callback(call, "❌ Topilmadi", show_alert=True)
 
     caption = f"{(item.get('poster_caption') or '').strip()}\n\n🆔 Kod: {code}".strip()
     msg = await bot.send_photo(CHANNEL2_ID, item["poster_file_id"], caption=caption, reply_markup=channel_series_kb(code))
-    item["channel_msg_id"] = msg.message_id
-    db[code] = item
-    save_db(db)
+    if get_item(code) is not None:
+        await catalog_update(code, "publish", channel_msg_id=msg.message_id)
 
     await call.message.edit_text("🚀 Kanalga keeetti tog'o")
-    await call.answer()
+    return await answer_callback(call)
 
 # ================== QIDIRISH (KOD) ==================
 @dp.message_handler(lambda m: m.text and m.text.strip().isdigit())
@@ -521,23 +2453,23 @@ async def search_movie(message: types.Message):
         await message.answer("❗ Avval kanalga obuna bo‘ling", reply_markup=subscribe_kb())
         return
 
-    db = load_db()
     code = message.text.strip()
-    item = db.get(code)
+    item = get_item(code)
 
     if not item:
         await message.answer("❌ Bunday kodli kino topilmadi", reply_markup=kb)
         return
 
-    update_stats(message.from_user.id)
+    update_stats(message.from_user.id, code)
+    await send_item_card(message.chat.id, message.from_user.id, code, item)
 
+async def send_item_card(chat_id: int, user_id: int, code: str, item: Dict[str, Any]) -> None:
     if item.get("type") == "movie":
         # 1 martalik token
-        token = str(random.randint(100000, 999999))
-        last_movie_request[message.from_user.id] = code
-        last_watch_token[message.from_user.id] = token
+        token = make_watch_token(code, user_id)
 
-        await message.answer_photo(
+        await bot.send_photo(
+            chat_id,
             item["post_file_id"],
             item.get("post_caption", ""),
             reply_markup=movie_watch_kb(code, token),
@@ -546,20 +2478,53 @@ async def search_movie(message: types.Message):
         return
 
     # serial: bot ichida “Barcha qismlari”
-    await message.answer_photo(
+    await bot.send_photo(
+        chat_id,
         item["poster_file_id"],
         item.get("poster_caption", ""),
         reply_markup=types.InlineKeyboardMarkup().add(
-            types.InlineKeyboardButton("📺 Barcha qismlari", callback_data=f"series_private:{code}")
+            types.InlineKeyboardButton("📺 Barcha qismlari", callback_data=series_private_cb.new(code=code))
         ),
         protect_content=True
     )
 
+def item_title(item: Dict[str, Any], limit: int = 48) -> str:
+    caption = item.get("poster_caption") if item.get("type") == "series" else item.get("post_caption")
+    for line in CODE_LINE_RE.sub("", caption or "").splitlines():
+        line = line.strip()
+        if line:
+            return line if len(line) <= limit else line[:limit - 1] + "…"
+    return ""
+
+def search_results_kb(results: List[Tuple[str, float]]) -> types.InlineKeyboardMarkup:
+    kb = types.InlineKeyboardMarkup(row_width=1)
+    for code, _ in results:
+        item = get_item(code) or {}
+        icon = "📺" if item.get("type") == "series" else "🎬"
+        kb.add(types.InlineKeyboardButton(f"{icon} {item_title(item) or code} · {code}", callback_data=find_cb.new(code=code)))
+    return kb
+
+@router.callback(find_cb)
+async def search_result_open(call: types.CallbackQuery, callback_data: dict):
+    if not await check_subscription(call.from_user.id):
+        await bot.send_message(call.from_user.id, "❗ Avval kanalga obuna bo‘ling", reply_markup=subscribe_kb())
+        return await answer_callback(call)
+
+    code = callback_data["code"]
+    item = get_item(code)
+    if not item:
+        return await answer_callback(call, "❌ Bunday kodli kino topilmadi", show_alert=True)
+
+    update_stats(call.from_user.id, code)
+    await send_item_card(call.from_user.id, call.from_user.id, code, item)
+    return await answer_callback(call)
+
 # ================== FILMNI KO‘RISH (YAKKA) ==================
 # Eski watch_ tugmalar (agar qolib ketsa) — doim eskirgan
-@dp.callback_query_handler(lambda c: c.data.startswith("watch_"))
+@router.callback("watch_")
 async def watch_old(call: types.CallbackQuery):
-    await call.answer(
+    return await answer_callback(
+        call,
         "❗ Tugma eskirgan. Faqat oxirgi so'ralgan filmni ko'rishingiz mumkin. "
         "Ushbu filmni ko'rish uchun esa kod orqali qayta qidiring yoki "
         "kanaldagi bu film posti ostidagi ko'rish tugmasini bosing ",
@@ -567,42 +2532,48 @@ async def watch_old(call: types.CallbackQuery):
     )
 
 # Yangi: 1 martalik
-@dp.callback_query_handler(lambda c: c.data.startswith("watch2_"))
+@router.callback("watch2_")
 async def watch_movie(call: types.CallbackQuery):
     parts = call.data.split("_", 2)  # watch2_<code>_<token>
     if len(parts) != 3:
-        await call.answer("❌ Topilmadi", show_alert=True)
-        return
+        return await answer_callback(call, "❌ Topilmadi", show_alert=True)
 
     code = parts[1]
     token = parts[2]
 
-    if last_movie_request.get(call.from_user.id) != code or last_watch_token.get(call.from_user.id) != token:
-        await call.answer(
-            "❗ Tugma eskirgan. Faqat oxirgi so'ralgan filmni ko'rishingiz mumkin. "
+    checked = check_watch_token(code, call.from_user.id, token)
+    if checked is None:
+        return await answer_callback(
+            call,
+            "❗ Tugma eskirgan yoki ishlatilgan. "
             "Ushbu filmni ko'rish uchun esa kod orqali qayta qidiring yoki "
             "kanaldagi bu film posti ostidagi ko'rish tugmasini bosing ",
             show_alert=True
         )
-        return
+
+    # TUGMA SHU YERDA ESKIRADI (1 martalik), birinchi await'dan oldin — ikki marta tez
+    # bosilsa ikkinchisi tekshiruvdan o‘tmaydi. Video yuborilmasa token qaytariladi.
+    exp, key = checked
+    redeem_watch_token(key, exp)
 
     if not await check_subscription(call.from_user.id):
+        _redeemed_tokens.pop(key, None)
         await call.message.answer("❗ Avval kanalga obuna bo‘lingda", reply_markup=subscribe_kb())
-        await call.answer()
-        return
+        return await answer_callback(call)
 
-    db = load_db()
-    item = db.get(code)
+    item = get_item(code)
     if not item or item.get("type") != "movie":
-        await call.answer("❌ Topilmadi", show_alert=True)
-        return
-
-    await bot.send_video(call.from_user.id, item["video_file_id"], protect_content=True)
+        _redeemed_tokens.pop(key, None)
+        return await answer_callback(call, "❌ Topilmadi", show_alert=True)
 
-    # ENDI TUGMA ESKIRADI (1 martalik)
-    last_watch_token.pop(call.from_user.id, None)
+    try:
+        await bot.send_video(call.from_user.id, item["video_file_id"], protect_content=True)
+    except Exception:
+        _redeemed_tokens.pop(key, None)
+        raise
+    record_play(code)
 
-    await call.answer()
+    return await answer_callback(call)
 
 # ================== SERIALNI USERGA YUBORISH (kanalga emas) ==================
 async def send_series_to_user(user_id: int, code: str):
@@ -610,13 +2581,12 @@ async def send_series_to_user(user_id: int, code: str):
         await bot.send_message(user_id, "❗ Avval kanalga obuna bo‘ling", reply_markup=subscribe_kb())
         return
 
-    db = load_db()
-    item = db.get(code)
+    item = get_item(code)
     if not item or item.get("type") != "series":
         await bot.send_message(user_id, "❌ Bunday kodli kino topilmadi", reply_markup=user_menu())
         return
 
-    ep_nums = _sorted_episode_numbers(item)
+    ep_nums = episode_numbers(code)
     if not ep_nums:
         await bot.send_message(user_id, "❌ Qismlar topilmadi", reply_markup=user_menu())
         return
@@ -628,61 +2598,75 @@ async def send_series_to_user(user_id: int, code: str):
             chat_id=user_id,
             from_chat_id=CHANNEL2_ID,
             message_id=ch_msg_id,
-            reply_markup=series_eps_kb(code, ep_nums),
+            reply_markup=series_eps_kb(code),
         )
     else:
         await bot.send_photo(
             chat_id=user_id,
             photo=item["poster_file_id"],
             caption=item.get("poster_caption", ""),
-            reply_markup=series_eps_kb(code, ep_nums),
+            reply_markup=series_eps_kb(code),
             protect_content=True
         )
 
-@dp.callback_query_handler(lambda c: c.data.startswith("series_private:"))
-async def series_private_from_bot(call: types.CallbackQuery):
-    code = call.data.split(":", 1)[1]
+@router.callback(series_private_cb)
+async def series_private_from_bot(call: types.CallbackQuery, callback_data: dict):
+    code = callback_data["code"]
     await send_series_to_user(call.from_user.id, code)
-    await call.answer()
+    return await answer_callback(call)
 
-@dp.callback_query_handler(lambda c: c.data.startswith("series_ep:"))
-async def series_ep(call: types.CallbackQuery):
-    _, code, ep_str = call.data.split(":")
-    ep_num = int(ep_str)
+@router.callback(series_page_cb)
+async def series_page(call: types.CallbackQuery, callback_data: dict):
+    code = callback_data["code"]
+    try:
+        await call.message.edit_reply_markup(series_eps_kb(code, int(callback_data["page"])))
+    except Exception:
+        pass
+    return await answer_callback(call)
+
+@router.callback("noop")
+async def noop_button(call: types.CallbackQuery):
+    return await answer_callback(call)
+
+@router.callback(series_ep_cb)
+async def series_ep(call: types.CallbackQuery, callback_data: dict):
+    code = callback_data["code"]
+    ep_num = int(callback_data["ep"])
 
     if not await check_subscription(call.from_user.id):
         await call.message.answer("❗ Avval kanalga obuna bo‘ling", reply_markup=subscribe_kb())
-        await call.answer()
-        return
+        return await answer_callback(call)
 
-    db = load_db()
-    item = db.get(code)
+    item = get_item(code)
     if not item or item.get("type") != "series":
-        await call.answer("❌ Topilmadi", show_alert=True)
-        return
+        return await answer_callback(call, "❌ Topilmadi", show_alert=True)
 
     ep = (item.get("episodes", {}) or {}).get(str(ep_num))
     if not ep:
-        await call.answer("❌ Topilmadi", show_alert=True)
-        return
+        return await answer_callback(call, "❌ Topilmadi", show_alert=True)
 
     cap = _episode_user_caption(ep_num, (ep or {}).get("title", ""))
     await bot.send_video(call.from_user.id, ep["video_file_id"], caption=cap, protect_content=True)
-    await call.answer()
+    record_play(code, ep_num)
+    return await answer_callback(call)
 
 # ================== STATISTIKA ==================
 def stats_text():
-    stats = load_stats()
+    st = _stats_engine()
     db = load_db()
     movies_count = sum(1 for v in db.values() if v.get("type") == "movie")
     series_count = sum(1 for v in db.values() if v.get("type") == "series")
+    today = st.today.get("count", 0) if st.today.get("date") == datetime.now().strftime("%Y-%m-%d") else 0
     return (
         "📊 <b>Bot statistikasi</b>\n\n"
-        f"👥 Userlar: <b>{len(stats.get('users', []))}</b>\n"
+        f"👥 Userlar: <b>{len(st.users)}</b>\n"
         f"🎬 Filmlar: <b>{movies_count}</b>\n"
         f"📺 Seriallar: <b>{series_count}</b>\n"
-        f"📥 Bugun so‘rovlar: <b>{stats.get('today', {}).get('count', 0)}</b>\n"
-        f"🔢 Jami so‘rovlar: <b>{stats.get('total_requests', 0)}</b>"
+        f"📥 Bugun so‘rovlar: <b>{today}</b>\n"
+        f"🔢 Jami so‘rovlar: <b>{st.total_requests}</b>\n"
+        f"🔔 Obuna: <b>{sub_cache_stats['tracked']}</b> kuzatuv / <b>{sub_cache_stats['hit']}</b> hit / "
+        f"<b>{sub_cache_stats['miss']}</b> miss\n"
+        f"📤 Yuborish: {send_scheduler.summary()}"
     )
 
 def stats_kb():
@@ -691,9 +2675,49 @@ def stats_kb():
         types.InlineKeyboardButton("🔄 Yangilash", callback_data="stats_refresh"),
         types.InlineKeyboardButton("❌ Yopish", callback_data="stats_close")
     )
+    kb.add(types.InlineKeyboardButton("🔥 Top va soatlar", callback_data="stats_top"))
     return kb
 
-@dp.message_handler(lambda m: m.text == "📊 Statistika")
+def analytics_text() -> str:
+    totals = analytics_rollup()
+    views: Counter = Counter()
+    plays: Counter = Counter()
+    eps: Counter = Counter()
+    hours = [0] * 24
+    for (kind, key, ep), n in totals.items():
+        if kind == A_HOUR:
+            hours[key] += n
+        elif kind == A_VIEW:
+            views[key] += n
+        elif kind == A_PLAY:
+            plays[key] += n
+            if ep:
+                eps[(key, ep)] += n
+
+    lines = [f"🔥 <b>Top {ANALYTICS_TOP_N}</b> (oxirgi {ANALYTICS_WINDOW_DAYS} kun, 👁 ochildi / ▶️ ko‘rildi)"]
+    for i, (key, _) in enumerate((views + plays).most_common(ANALYTICS_TOP_N), 1):
+        title = item_title(get_item(str(key)) or {}, 28) or "—"
+        lines.append(f"{i}. <b>{key}</b> {title} — 👁 {views[key]} / ▶️ {plays[key]}")
+    if eps:
+        lines.append("\n📺 <b>Top qismlar</b>")
+        for (key, ep), n in eps.most_common(5):
+            lines.append(f"{key}, {ep}-qisim — ▶️ {n}")
+
+    lines.append("\n🕐 <b>Soatlar bo‘yicha so‘rovlar</b>")
+    peak = max(hours) or 1
+    for h, n in enumerate(hours):
+        lines.append(f"<code>{h:02d} {'█' * round(n * 12 / peak):<12} {n}</code>")
+    return "\n".join(lines)
+
+def analytics_kb():
+    kb = types.InlineKeyboardMarkup()
+    kb.add(
+        types.InlineKeyboardButton("⬅️ Orqaga", callback_data="stats_refresh"),
+        types.InlineKeyboardButton("🔄 Yangilash", callback_data="stats_top")
+    )
+    return kb
+
+@router.text("📊 Statistika")
 async def show_stats(message: types.Message):
     if not is_admin(message.from_user.id):
         await message.answer(
@@ -704,21 +2728,31 @@ async def show_stats(message: types.Message):
         return
     await message.answer(stats_text(), reply_markup=stats_kb())
 
-@dp.callback_query_handler(lambda c: c.data == "stats_refresh")
+@router.callback("stats_refresh")
 async def refresh_stats(call: types.CallbackQuery):
     await call.message.edit_text(stats_text(), reply_markup=stats_kb())
-    await call.answer()
+    return await answer_callback(call)
 
-@dp.callback_query_handler(lambda c: c.data == "stats_close")
+@router.callback("stats_top")
+async def show_analytics(call: types.CallbackQuery):
+    if not is_admin(call.from_user.id):
+        return await answer_callback(call)
+    try:
+        await call.message.edit_text(analytics_text(), reply_markup=analytics_kb())
+    except Exception:
+        pass    # o‘zgarmagan bo‘lsa Telegram xato qaytaradi
+    return await answer_callback(call)
+
+@router.callback("stats_close")
 async def close_stats(call: types.CallbackQuery):
     try:
         await call.message.delete()
     except Exception:
         pass
-    await call.answer()
+    return await answer_callback(call)
 
 # ================== BACKUP ==================
-@dp.message_handler(lambda m: m.text == "📦 Kino backup")
+@router.text("📦 Kino backup")
 async def backup_movies(message: types.Message):
     if not is_admin(message.from_user.id):
         await message.answer(
@@ -727,12 +2761,18 @@ async def backup_movies(message: types.Message):
             reply_markup=user_menu()
         )
         return
+    await compact_catalog()
+    if MOVIES_BACKEND == "sqlite":
+        # SQLite da ham backup odatdagi movies.json formatida
+        raw = await run_cpu(lambda snap: json.dumps(snap, ensure_ascii=False, indent=2, default=_json_default).encode("utf-8"), dict(load_db()))
+        await message.answer_document(types.InputFile(io.BytesIO(raw), filename="movies.json"), reply_markup=admin_menu())
+        return
     if not os.path.exists(MOVIES_FILE):
         await message.answer("❌ movies.json topilmadi", reply_markup=admin_menu())
         return
     await message.answer_document(types.InputFile(MOVIES_FILE), reply_markup=admin_menu())
 
-@dp.message_handler(lambda m: m.text == "📈 Statistika backup")
+@router.text("📈 Statistika backup")
 async def backup_stats(message: types.Message):
     if not is_admin(message.from_user.id):
         await message.answer(
@@ -741,13 +2781,285 @@ async def backup_stats(message: types.Message):
             reply_markup=user_menu()
         )
         return
+    await flush_stats_async()
     if not os.path.exists(STATS_FILE):
         await message.answer("❌ statistics.json topilmadi", reply_markup=admin_menu())
         return
     await message.answer_document(types.InputFile(STATS_FILE), reply_markup=admin_menu())
 
+# ================== METRIKALAR (eksport) ==================
+def _prom_histograms(lines: List[str], name: str, label: str, family: Dict[str, Histogram]) -> None:
+    lines.append(f"# TYPE {name} histogram")
+    for key, h in sorted(family.items()):
+        acc = 0
+        for le, c in zip(_LATENCY_BUCKETS + ("+Inf",), h.counts):
+            acc += c
+            lines.append(f'{name}_bucket{{{label}="{key}",le="{le}"}} {acc}')
+        lines.append(f'{name}_sum{{{label}="{key}"}} {h.sum:.6f}')
+        lines.append(f'{name}_count{{{label}="{key}"}} {h.count}')
+
+def metrics_text() -> str:
+    """Prometheus exposition formati (text/plain; version=0.0.4)."""
+    lines: List[str] = []
+    _prom_histograms(lines, "kino_handler_seconds", "handler", metrics.handlers)
+    _prom_histograms(lines, "kino_api_seconds", "method", metrics.api)
+    lines.append("# TYPE kino_api_errors_total counter")
+    lines.extend(f'kino_api_errors_total{{method="{m}"}} {n}' for m, n in sorted(metrics.api_errors.items()))
+    lines.append("# TYPE kino_storage_ops_total counter")
+    for op in ("storage_load", "storage_save_batch", "storage_save_snapshot"):
+        lines.append(f'kino_storage_ops_total{{op="{op[8:]}"}} {metrics.counters[op]}')
+    lines.append("# TYPE kino_subscription_checks_total counter")
+    for outcome, n in sub_cache_stats.items():
+        lines.append(f'kino_subscription_checks_total{{outcome="{outcome}"}} {n}')
+    for outcome in ("ok", "not_member", "error"):
+        lines.append(f'kino_subscription_checks_total{{outcome="api_{outcome}"}} {metrics.counters["sub_api_" + outcome]}')
+    _prom_histograms(lines, "kino_update_queue_wait_seconds", "type", metrics.update_wait)
+    lines.append("# TYPE kino_update_queue_depth gauge")
+    lines.append(f"kino_update_queue_depth {update_pool.depth}")
+    lines.append("# TYPE kino_update_queue_full_total counter")
+    lines.append(f"kino_update_queue_full_total {update_pool.full}")
+    lines.append("# TYPE kino_update_errors_total counter")
+    lines.append(f"kino_update_errors_total {metrics.counters['update_errors']}")
+    lines.append("# TYPE kino_send_queue_depth gauge")
+    lines.append(f"kino_send_queue_depth {send_scheduler.depth}")
+    lines.append("# TYPE kino_send_retry_after_total counter")
+    lines.append(f"kino_send_retry_after_total {send_scheduler.retry_after}")
+    lines.append("# TYPE kino_catalog_items gauge")
+    lines.append(f"kino_catalog_items {len(_catalog)}")
+    return "\n".join(lines) + "\n"
+
+def metrics_summary(top: int = 8) -> str:
+    def rows(family: Dict[str, Histogram]) -> List[str]:
+        busiest = sorted(family.items(), key=lambda kv: kv[1].sum, reverse=True)[:top]
+        return [
+            f"<code>{name[:24]:<24} {h.count:>7} {h.sum / h.count * 1e3:>7.1f} {h.quantile(0.95) * 1e3:>7.1f}</code>"
+            for name, h in busiest
+        ]
+    head = f"<code>{'':<24} {'soni':>7} {'o‘rt ms':>7} {'p95 ms':>7}</code>"
+    c = metrics.counters
+    return "\n".join([
+        "⏱ <b>Handlerlar</b>", head, *rows(metrics.handlers),
+        "\n📡 <b>Bot API</b>", head, *rows(metrics.api),
+        f"xatolar: {sum(metrics.api_errors.values())}",
+        "\n📥 <b>Update navbati</b> (kutish)", head, *rows(metrics.update_wait),
+        f"navbat {update_pool.depth}/{update_pool.capacity}, to‘lgan: {update_pool.full}, xato: {c['update_errors']}",
+        f"\n💾 Katalog: o‘qish {c['storage_load']}, yozish {c['storage_save_batch']} (+{c['storage_save_snapshot']} snapshot)",
+        f"🔔 Obuna: {sub_cache_stats['tracked']} kuzatuv / {sub_cache_stats['hit']} hit / {sub_cache_stats['miss']} miss; "
+        f"API: {c['sub_api_ok']} ok / {c['sub_api_not_member']} yo‘q / {c['sub_api_error']} xato",
+    ])
+
+@dp.message_handler(commands=["metrics"])
+async def show_metrics(message: types.Message):
+    if not is_admin(message.from_user.id):
+        await message.answer(
+            "❌ <b>Brat siz admin emassiz!</b>\n"
+            "🎬 Faqat <b>Qidiruv</b> tugmasidan foydalanishingiz mumkin.",
+            reply_markup=user_menu()
+        )
+        return
+    await message.answer(metrics_summary(), reply_markup=admin_menu())
+
+async def metrics_endpoint(request: web.Request) -> web.Response:
+    return web.Response(text=metrics_text(), content_type="text/plain", headers={"X-Content-Type-Options": "nosniff"})
+
+async def start_metrics_server() -> None:
+    if not METRICS_PORT:
+        return
+    app = web.Application()
+    app.router.add_get("/metrics", metrics_endpoint)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, METRICS_HOST, METRICS_PORT).start()
+
+# ================== XABAR TARQATISH ==================
+# Xabar (admin chatidan copyMessage) yoki katalog kodi barcha foydalanuvchilarga yuboriladi.
+# Yuborishlar PRIO_BULK navbatida: oddiy javoblar doim oldinda. Holat har N ta yuborishda
+# BROADCAST_FILE ga yoziladi, restartdan keyin shu joydan davom etadi.
+_BROADCAST_GONE = (BotBlocked, UserDeactivated, ChatNotFound, CantInitiateConversation, CantTalkWithBots)
+
+_broadcast: Optional[Dict[str, Any]] = None     # joriy ish
+_broadcast_stop = False
+
+def _broadcast_users_file() -> str:
+    return BROADCAST_FILE + ".users"
+
+def _start_broadcast_files(job: Dict[str, Any], users: List[int]) -> None:
+    _atomic_write_json(_broadcast_users_file(), users)
+    _atomic_write_json(BROADCAST_FILE, job)
+
+def _load_broadcast() -> Optional[Tuple[Dict[str, Any], List[int]]]:
+    try:
+        with open(BROADCAST_FILE, "r", encoding="utf-8") as f:
+            job = json.load(f)
+        with open(_broadcast_users_file(), "r", encoding="utf-8") as f:
+            users = json.load(f)
+    except Exception:
+        return None
+    return job, users
+
+def _clear_broadcast_files() -> None:
+    for path in (BROADCAST_FILE, _broadcast_users_file()):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+def broadcast_text(job: Dict[str, Any], final: bool = False) -> str:
+    if not final:
+        head = "📣 <b>Xabar tarqatilmoqda...</b>"
+    elif job["cursor"] < job["total"]:
+        head = "⏹ <b>Xabar tarqatish to‘xtatildi</b>"
+    else:
+        head = "📣 <b>Xabar tarqatish tugadi</b>"
+    total = job["total"] or 1
+    return (
+        f"{head}\n\n"
+        f"📨 {job['cursor']}/{job['total']} ({job['cursor'] * 100 // total}%)\n"
+        f"✅ Yetkazildi: {job['sent']}\n"
+        f"🚫 Bloklagan/o‘chgan: {job['blocked']}\n"
+        f"⚠️ Xato: {job['failed']}"
+    )
+
+def broadcast_stop_kb() -> types.InlineKeyboardMarkup:
+    return types.InlineKeyboardMarkup().add(types.InlineKeyboardButton("⏹ To‘xtatish", callback_data="bc_stop"))
+
+async def _broadcast_report(job: Dict[str, Any], final: bool = False) -> None:
+    token = send_priority.set(PRIO_USER)     # admin oynasi navbatda kutmasin
+    try:
+        await bot.edit_message_text(
+            broadcast_text(job, final), job["report_chat_id"], job["report_msg_id"],
+            reply_markup=None if final else broadcast_stop_kb()
+        )
+    except Exception:
+        pass
+    finally:
+        send_priority.reset(token)
+
+async def _broadcast_one(user_id: int, job: Dict[str, Any]) -> str:
+    try:
+        if job.get("code"):
+            item = get_item(job["code"])
+            if not item:
+                return "failed"
+            await send_item_card(user_id, user_id, job["code"], item)
+        else:
+            await bot.copy_message(user_id, job["from_chat_id"], job["message_id"])
+        return "sent"
+    except _BROADCAST_GONE:
+        return "blocked"
+    except Exception:
+        return "failed"
+
+async def run_broadcast(job: Dict[str, Any], users: List[int]) -> None:
+    global _broadcast, _broadcast_stop
+    send_priority.set(PRIO_BULK)     # faqat shu task konteksti uchun
+    _broadcast, _broadcast_stop = job, False
+    saved_at, reported_at = job["cursor"], 0.0
+    while job["cursor"] < len(users) and not _broadcast_stop:
+        chunk = users[job["cursor"]:job["cursor"] + BROADCAST_CONCURRENCY]
+        results = await asyncio.gather(*(_broadcast_one(uid, job) for uid in chunk))
+        for r in results:
+            job[r] += 1
+        gone = [uid for uid, r in zip(chunk, results) if r == "blocked"]
+        if gone:
+            forget_users(gone)
+        job["cursor"] += len(chunk)
+
+        if job["cursor"] - saved_at >= BROADCAST_CHECKPOINT_EVERY:
+            saved_at = job["cursor"]
+            await run_io(_atomic_write_json, BROADCAST_FILE, dict(job))
+        if time.monotonic() - reported_at >= BROADCAST_PROGRESS_INTERVAL:
+            reported_at = time.monotonic()
+            await _broadcast_report(job)
+
+    _broadcast = None
+    await run_io(_clear_broadcast_files)
+    await _broadcast_report(job, final=True)
+
+async def resume_broadcast() -> None:
+    loaded = await run_io(_load_broadcast)
+    if loaded:
+        asyncio.get_event_loop().create_task(run_broadcast(*loaded))
+
+@router.text("📣 Xabar tarqatish")
+async def broadcast_btn(message: types.Message):
+    if not is_admin(message.from_user.id):
+        await message.answer(
+            "❌ <b>Brat siz admin emassiz!</b>\n"
+            "🎬 Faqat <b>Qidiruv</b> tugmasidan foydalanishingiz mumkin.",
+            reply_markup=user_menu()
+        )
+        return
+    if _broadcast is not None:
+        await message.answer(broadcast_text(_broadcast), reply_markup=broadcast_stop_kb())
+        return
+    await message.answer(
+        "📨 Tarqatiladigan xabarni yuboring (matn, rasm, video...)\n"
+        "yoki katalogdagi <b>kino kodini</b> yozing.",
+        reply_markup=admin_menu()
+    )
+    await BroadcastFlow.message.set()
+
+@dp.message_handler(content_types=types.ContentType.ANY, state=BroadcastFlow.message)
+async def broadcast_message(message: types.Message, state: FSMContext):
+    text = (message.text or "").strip()
+    if text.isdigit():
+        if not get_item(text):
+            await message.answer("❌ Bunday kodli kino topilmadi", reply_markup=admin_menu())
+            return
+        await state.update_data(bc_code=text)
+        what = f"🆔 {text} kodli kino"
+    else:
+        await state.update_data(bc_code=None, from_chat_id=message.chat.id, message_id=message.message_id)
+        what = "Shu xabar"
+
+    kb = types.InlineKeyboardMarkup()
+    kb.add(
+        types.InlineKeyboardButton("✅ Yuborish", callback_data="bc_go"),
+        types.InlineKeyboardButton("❌ Bekor", callback_data="bc_cancel")
+    )
+    await message.answer(f"{what} 👥 {len(_stats_engine().users)} ta foydalanuvchiga yuborilsinmi?", reply_markup=kb)
+    await BroadcastFlow.confirm.set()
+
+@router.callback("bc_cancel", state=BroadcastFlow.confirm)
+async def broadcast_cancel(call: types.CallbackQuery, state: FSMContext):
+    await state.finish()
+    await call.message.edit_reply_markup()
+    return await answer_callback(call, "❎ Bekor qilindi")
+
+@router.callback("bc_go", state=BroadcastFlow.confirm)
+async def broadcast_go(call: types.CallbackQuery, state: FSMContext):
+    data = await state.get_data()
+    await state.finish()
+    if _broadcast is not None:
+        return await answer_callback(call, "⏳ Boshqa tarqatish ketmoqda", show_alert=True)
+
+    users = sorted(_stats_engine().users)
+    job = {
+        "code": data.get("bc_code"),
+        "from_chat_id": data.get("from_chat_id"),
+        "message_id": data.get("message_id"),
+        "total": len(users),
+        "cursor": 0, "sent": 0, "blocked": 0, "failed": 0,
+        "started": int(time.time()),
+        "report_chat_id": call.message.chat.id,
+        "report_msg_id": call.message.message_id,
+    }
+    await call.message.edit_text(broadcast_text(job), reply_markup=broadcast_stop_kb())
+    await run_io(_start_broadcast_files, job, users)
+    asyncio.get_event_loop().create_task(run_broadcast(job, users))
+    return await answer_callback(call)
+
+@router.callback("bc_stop", state="*")
+async def broadcast_stop(call: types.CallbackQuery):
+    global _broadcast_stop
+    if not is_admin(call.from_user.id):
+        return await answer_callback(call)
+    _broadcast_stop = True
+    return await answer_callback(call, "⏹ To‘xtatilmoqda...")
+
 # ================== O‘CHIRISH ==================
-@dp.message_handler(lambda m: m.text == "🗑 O‘chirish")
+@router.text("🗑 O‘chirish")
 async def del_btn(message: types.Message, state: FSMContext):
     if not is_admin(message.from_user.id):
         await message.answer(
@@ -767,8 +3079,7 @@ async def delete_item(message: types.Message, state: FSMContext):
         await message.answer("🗑 Koddi ayting tog'o", reply_markup=admin_menu())
         return
 
-    db = load_db()
-    item = db.get(code)
+    item = get_item(code)
     if not item:
         await message.answer("❌ Bunaqa kino o'zi yo'q tog'o", reply_markup=admin_menu())
         await state.finish()
@@ -781,8 +3092,7 @@ async def delete_item(message: types.Message, state: FSMContext):
         except Exception:
             pass
 
-    del db[code]
-    save_db(db)
+    await catalog_delete(code)
 
     await message.answer(f"🗑 O'chirib tashadim tog'o\n🆔 Kod: {code}", reply_markup=admin_menu())
     await state.finish()
@@ -791,32 +3101,32 @@ async def delete_item(message: types.Message, state: FSMContext):
 def edit_type_kb():
     kb = types.InlineKeyboardMarkup(row_width=2)
     kb.add(
-        types.InlineKeyboardButton("🎬 Yakka film", callback_data="edit_type:movie"),
-        types.InlineKeyboardButton("📺 Serial", callback_data="edit_type:series"),
+        types.InlineKeyboardButton("🎬 Yakka film", callback_data=edit_type_cb.new(kind="movie")),
+        types.InlineKeyboardButton("📺 Serial", callback_data=edit_type_cb.new(kind="series")),
     )
     return kb
 
 def edit_movie_kb(code: str):
     kb = types.InlineKeyboardMarkup(row_width=1)
     kb.add(
-        types.InlineKeyboardButton("♻️ Kanal1 postni yuboring", callback_data=f"edit_movie_post:{code}"),
-        types.InlineKeyboardButton("🎥 Kanal1 video yuboring", callback_data=f"edit_movie_video:{code}"),
-        types.InlineKeyboardButton("🗑 O‘chirish", callback_data=f"edit_delete:{code}")
+        types.InlineKeyboardButton("♻️ Kanal1 postni yuboring", callback_data=edit_movie_post_cb.new(code=code)),
+        types.InlineKeyboardButton("🎥 Kanal1 video yuboring", callback_data=edit_movie_video_cb.new(code=code)),
+        types.InlineKeyboardButton("🗑 O‘chirish", callback_data=edit_delete_cb.new(code=code))
     )
     return kb
 
 def edit_series_kb(code: str):
     kb = types.InlineKeyboardMarkup(row_width=1)
     kb.add(
-        types.InlineKeyboardButton("♻️ Kanal1 postni yuboring", callback_data=f"edit_series_post:{code}"),
-        types.InlineKeyboardButton("➕ Yangi qism (video yuboring)", callback_data=f"series_add:{code}"),
-        types.InlineKeyboardButton("🔁 Qismni almashtirish (video yuboring)", callback_data=f"series_replace:{code}"),
-        types.InlineKeyboardButton("🗑 Qismni o‘chirish", callback_data=f"series_del:{code}"),
-        types.InlineKeyboardButton("🗑 Serialni o‘chirish", callback_data=f"edit_delete:{code}")
+        types.InlineKeyboardButton("♻️ Kanal1 postni yuboring", callback_data=edit_series_post_cb.new(code=code)),
+        types.InlineKeyboardButton("➕ Yangi qism (video yuboring)", callback_data=series_add_cb.new(code=code)),
+        types.InlineKeyboardButton("🔁 Qismni almashtirish (video yuboring)", callback_data=series_replace_cb.new(code=code)),
+        types.InlineKeyboardButton("🗑 Qismni o‘chirish", callback_data=series_del_cb.new(code=code)),
+        types.InlineKeyboardButton("🗑 Serialni o‘chirish", callback_data=edit_delete_cb.new(code=code))
     )
     return kb
 
-@dp.message_handler(lambda m: m.text == "✏️ Tahrirlash")
+@router.text("✏️ Tahrirlash")
 async def edit_start(message: types.Message, state: FSMContext):
     if not is_admin(message.from_user.id):
         await message.answer(
@@ -829,13 +3139,13 @@ async def edit_start(message: types.Message, state: FSMContext):
     await message.answer("Nimani tahrirlaymiz?", reply_markup=edit_type_kb())
     await EditFlow.choose_type.set()
 
-@dp.callback_query_handler(lambda c: c.data.startswith("edit_type:"), state=EditFlow.choose_type)
-async def edit_choose_type(call: types.CallbackQuery, state: FSMContext):
-    typ = call.data.split(":", 1)[1]
+@router.callback(edit_type_cb, state=EditFlow.choose_type)
+async def edit_choose_type(call: types.CallbackQuery, state: FSMContext, callback_data: dict):
+    typ = callback_data["kind"]
     await state.update_data(edit_type=typ)
     await call.message.edit_text("🆔 Koddi ayting tog'o")
     await EditFlow.choose_code.set()
-    await call.answer()
+    return await answer_callback(call)
 
 @dp.message_handler(state=EditFlow.choose_code)
 async def edit_choose_code(message: types.Message, state: FSMContext):
@@ -844,10 +3154,9 @@ async def edit_choose_code(message: types.Message, state: FSMContext):
         await message.answer("🆔 Koddi ayting tog'o", reply_markup=admin_menu())
         return
 
-    db = load_db()
     data = await state.get_data()
     typ = data.get("edit_type")
-    item = db.get(code)
+    item = get_item(code)
 
     if not item or item.get("type") != typ:
         await message.answer("❌ Bunaqa kino o'zi yo'q tog'o", reply_markup=admin_menu())
@@ -861,63 +3170,61 @@ async def edit_choose_code(message: types.Message, state: FSMContext):
         await message.answer("📺 Tahrirlash:", reply_markup=edit_series_kb(code))
     await EditFlow.choose_action.set()
 
-@dp.callback_query_handler(lambda c: c.data.startswith("edit_movie_post:"), state=EditFlow.choose_action)
-async def edit_movie_post(call: types.CallbackQuery, state: FSMContext):
-    code = call.data.split(":", 1)[1]
+@router.callback(edit_movie_post_cb, state=EditFlow.choose_action)
+async def edit_movie_post(call: types.CallbackQuery, state: FSMContext, callback_data: dict):
+    code = callback_data["code"]
     await state.update_data(pending=("movie_post", code))
     await call.message.answer("♻️ Kanal1 (baza)dagi <b>yangilangan postni</b> forward qiling.", reply_markup=admin_menu())
     await EditFlow.await_forward.set()
-    await call.answer()
+    return await answer_callback(call)
 
-@dp.callback_query_handler(lambda c: c.data.startswith("edit_movie_video:"), state=EditFlow.choose_action)
-async def edit_movie_video(call: types.CallbackQuery, state: FSMContext):
-    code = call.data.split(":", 1)[1]
+@router.callback(edit_movie_video_cb, state=EditFlow.choose_action)
+async def edit_movie_video(call: types.CallbackQuery, state: FSMContext, callback_data: dict):
+    code = callback_data["code"]
     await state.update_data(pending=("movie_video", code))
     await call.message.answer("🎥 Kanal1 (baza)dagi <b>yangilangan videoni</b> forward qiling.", reply_markup=admin_menu())
     await EditFlow.await_forward.set()
-    await call.answer()
+    return await answer_callback(call)
 
-@dp.callback_query_handler(lambda c: c.data.startswith("edit_series_post:"), state=EditFlow.choose_action)
-async def edit_series_post(call: types.CallbackQuery, state: FSMContext):
-    code = call.data.split(":", 1)[1]
+@router.callback(edit_series_post_cb, state=EditFlow.choose_action)
+async def edit_series_post(call: types.CallbackQuery, state: FSMContext, callback_data: dict):
+    code = callback_data["code"]
     await state.update_data(pending=("series_post", code))
     await call.message.answer("♻️ Kanal1 (baza)dagi <b>yangilangan poster postni</b> forward qiling.", reply_markup=admin_menu())
     await EditFlow.await_forward.set()
-    await call.answer()
+    return await answer_callback(call)
 
-@dp.callback_query_handler(lambda c: c.data.startswith("series_add:"), state=EditFlow.choose_action)
-async def edit_series_add(call: types.CallbackQuery, state: FSMContext):
-    code = call.data.split(":", 1)[1]
+@router.callback(series_add_cb, state=EditFlow.choose_action)
+async def edit_series_add(call: types.CallbackQuery, state: FSMContext, callback_data: dict):
+    code = callback_data["code"]
     await state.update_data(pending=("series_add", code))
     await call.message.answer("➕ Kanal1 dan videoni forward qiling.\nMasalan: <b>1 Yura davri 3</b>", reply_markup=admin_menu())
     await EditFlow.await_forward.set()
-    await call.answer()
+    return await answer_callback(call)
 
-@dp.callback_query_handler(lambda c: c.data.startswith("series_replace:"), state=EditFlow.choose_action)
-async def edit_series_replace(call: types.CallbackQuery, state: FSMContext):
-    code = call.data.split(":", 1)[1]
+@router.callback(series_replace_cb, state=EditFlow.choose_action)
+async def edit_series_replace(call: types.CallbackQuery, state: FSMContext, callback_data: dict):
+    code = callback_data["code"]
     await state.update_data(pending=("series_replace", code))
     await call.message.answer("🔁 Kanal1 dan videoni forward qiling.\nMasalan: <b>1 Yura davri 3</b>", reply_markup=admin_menu())
     await EditFlow.await_forward.set()
-    await call.answer()
+    return await answer_callback(call)
 
-@dp.callback_query_handler(lambda c: c.data.startswith("series_del:"), state=EditFlow.choose_action)
-async def edit_series_del(call: types.CallbackQuery, state: FSMContext):
-    code = call.data.split(":", 1)[1]
+@router.callback(series_del_cb, state=EditFlow.choose_action)
+async def edit_series_del(call: types.CallbackQuery, state: FSMContext, callback_data: dict):
+    code = callback_data["code"]
     await state.update_data(pending=("series_del", code))
     await call.message.answer("🗑 Qaysi qisimni o‘chiramiz? (raqam yuboring, masalan: 1)", reply_markup=admin_menu())
     await EditFlow.await_ep_delete.set()
-    await call.answer()
+    return await answer_callback(call)
 
-@dp.callback_query_handler(lambda c: c.data.startswith("edit_delete:"), state=EditFlow.choose_action)
-async def edit_delete(call: types.CallbackQuery, state: FSMContext):
-    code = call.data.split(":", 1)[1]
-    db = load_db()
-    item = db.get(code)
+@router.callback(edit_delete_cb, state=EditFlow.choose_action)
+async def edit_delete(call: types.CallbackQuery, state: FSMContext, callback_data: dict):
+    code = callback_data["code"]
+    item = get_item(code)
     if not item:
-        await call.answer("❌ Topilmadi", show_alert=True)
         await state.finish()
-        return
+        return await answer_callback(call, "❌ Topilmadi", show_alert=True)
 
     msg_id = item.get("channel_msg_id")
     if msg_id:
@@ -926,11 +3233,10 @@ async def edit_delete(call: types.CallbackQuery, state: FSMContext):
         except Exception:
             pass
 
-    del db[code]
-    save_db(db)
+    await catalog_delete(code)
     await call.message.answer(f"🗑 O'chirib tashadim tog'o\n🆔 Kod: {code}", reply_markup=admin_menu())
     await state.finish()
-    await call.answer()
+    return await answer_callback(call)
 
 @dp.message_handler(state=EditFlow.await_ep_delete)
 async def edit_series_del_number(message: types.Message, state: FSMContext):
@@ -949,8 +3255,7 @@ async def edit_series_del_number(message: types.Message, state: FSMContext):
         return
 
     code = pending[1]
-    db = load_db()
-    item = db.get(code)
+    item = get_item(code)
     if not item or item.get("type") != "series":
         await message.answer("❌ Bunaqa kino o'zi yo'q tog'o", reply_markup=admin_menu())
         await state.finish()
@@ -961,10 +3266,7 @@ async def edit_series_del_number(message: types.Message, state: FSMContext):
         await message.answer("❌ Bunaqa qisim yo'q tog'o", reply_markup=admin_menu())
         return
 
-    del eps[str(ep_num)]
-    item["episodes"] = eps
-    db[code] = item
-    save_db(db)
+    await catalog_delete_episode(code, ep_num)
 
     await message.answer(f"🗑 O'chirib tashadim tog'o\n🆔 Kod: {code}", reply_markup=admin_menu())
     await state.finish()
@@ -983,8 +3285,7 @@ async def edit_receive_forward(message: types.Message, state: FSMContext):
         return
 
     action, code = pending
-    db = load_db()
-    item = db.get(code)
+    item = get_item(code)
 
     if not item:
         await message.answer("❌ Bunaqa kino o'zi yo'q tog'o", reply_markup=admin_menu())
@@ -1013,10 +3314,8 @@ async def edit_receive_forward(message: types.Message, state: FSMContext):
                 except Exception:
                     pass
 
-        item["post_file_id"] = new_photo
-        item["post_caption"] = new_caption
-        db[code] = item
-        save_db(db)
+        if get_item(code) is not None:
+            await catalog_update(code, "edit_post", post_file_id=new_photo, post_caption=new_caption)
 
         await message.answer("✅ Yangilandi tog'o", reply_markup=admin_menu())
         await state.finish()
@@ -1028,14 +3327,12 @@ async def edit_receive_forward(message: types.Message, state: FSMContext):
             await message.answer("❗ Video forward qiling.", reply_markup=admin_menu())
             return
 
-        if _duplicate_video_exists(db, message.video.file_unique_id):
-            await message.answer("❗ Bu kino borku tog'o", reply_markup=admin_menu())
+        owner = find_video_owner(message.video.file_unique_id)
+        if owner:
+            await message.answer(_duplicate_text(owner), reply_markup=admin_menu())
             return
 
-        item["video_file_id"] = message.video.file_id
-        item["video_unique_id"] = message.video.file_unique_id
-        db[code] = item
-        save_db(db)
+        await catalog_update(code, "edit_video", video_file_id=message.video.file_id, video_unique_id=message.video.file_unique_id)
 
         await message.answer("✅ Yangilandi tog'o", reply_markup=admin_menu())
         await state.finish()
@@ -1063,10 +3360,8 @@ async def edit_receive_forward(message: types.Message, state: FSMContext):
                 except Exception:
                     pass
 
-        item["poster_file_id"] = new_photo
-        item["poster_caption"] = new_caption
-        db[code] = item
-        save_db(db)
+        if get_item(code) is not None:
+            await catalog_update(code, "edit_post", poster_file_id=new_photo, poster_caption=new_caption)
 
         await message.answer("✅ Yangilandi tog'o", reply_markup=admin_menu())
         await state.finish()
@@ -1083,8 +3378,9 @@ async def edit_receive_forward(message: types.Message, state: FSMContext):
             await message.answer("❗ Video captionida qism raqimi yo‘q.\nMasalan: <b>1 Yura davri 3</b>", reply_markup=admin_menu())
             return
 
-        if _duplicate_video_exists(db, message.video.file_unique_id):
-            await message.answer("❗ Bu kino borku tog'o", reply_markup=admin_menu())
+        owner = find_video_owner(message.video.file_unique_id)
+        if owner:
+            await message.answer(_duplicate_text(owner), reply_markup=admin_menu())
             return
 
         eps = item.get("episodes", {}) or {}
@@ -1097,14 +3393,11 @@ async def edit_receive_forward(message: types.Message, state: FSMContext):
             await message.answer("❗ Bu qisim yo'q tog'o. Yangi qisim qo‘shish tanlang.", reply_markup=admin_menu())
             return
 
-        eps[str(ep_num)] = {
+        await catalog_set_episode(code, ep_num, {
             "video_file_id": message.video.file_id,
             "video_unique_id": message.video.file_unique_id,
             "title": (ep_title or "").strip()
-        }
-        item["episodes"] = eps
-        db[code] = item
-        save_db(db)
+        })
 
         await message.answer("✅ Yangilandi tog'o", reply_markup=admin_menu())
         await state.finish()
@@ -1114,12 +3407,91 @@ async def edit_receive_forward(message: types.Message, state: FSMContext):
     await state.finish()
 
 # ================== OBUNA TEKSHIR ==================
-@dp.callback_query_handler(lambda c: c.data == "check_sub")
+@router.callback("check_sub")
 async def recheck(call: types.CallbackQuery):
-    if await check_subscription(call.from_user.id):
+    if await check_subscription(call.from_user.id, force=True):
         await call.message.edit_text("✅ Obuna tasdiqlandi. Kod yuboring.")
     else:
-        await call.answer("❌ Hali obuna bo'lmadingizku 😕", show_alert=True)
+        return await answer_callback(call, "❌ Hali obuna bo'lmadingizku 😕", show_alert=True)
+
+# Bot majburiy kanallarda admin bo‘lsa, kirish/chiqishlar shu yerga keladi
+@dp.chat_member_handler(lambda u: u.chat.id in (FORCE_SUB_1_ID, FORCE_SUB_2_ID))
+async def track_channel_member(update: types.ChatMemberUpdated):
+    member = update.new_chat_member
+    _set_member(update.chat.id, member.user.id, member.status in _MEMBER_STATUSES)
+    _sub_cache.pop(member.user.id, None)
+
+# ================== INLINE REJIM ==================
+# @bot <kod yoki nom>: natijalar katalogdagi rasm (file_id) va captionlardan quriladi.
+# Bir xil so‘rov qayta hisoblanmaydi (LRU), sahifalar offset orqali beriladi.
+def inline_hits(query: str) -> List[str]:
+    q = query.strip()
+    key = q if q.isdigit() else " ".join(normalize_words(q))
+    hits = _inline_cache.get(key)
+    if hits is not None:
+        _inline_cache.move_to_end(key)
+        return hits
+
+    db = load_db()
+    if not key:
+        hits = list(itertools.islice(reversed(db.keys()), INLINE_MAX_RESULTS))     # eng yangilari
+    elif key.isdigit():
+        hits = [key] if key in db else []
+    else:
+        hits = [code for code, _ in search_titles(key, INLINE_MAX_RESULTS)]
+
+    _inline_cache[key] = hits
+    if len(_inline_cache) > INLINE_LRU_SIZE:
+        _inline_cache.popitem(last=False)
+    return hits
+
+def inline_result(code: str, item: Dict[str, Any]) -> Optional[types.InlineQueryResultCachedPhoto]:
+    if item.get("type") == "series":
+        photo, caption, kb = item.get("poster_file_id"), item.get("poster_caption", ""), channel_series_kb(code)
+    else:
+        photo, caption, kb = item.get("post_file_id"), item.get("post_caption", ""), channel_movie_kb(code)
+    if not photo:
+        return None
+    return types.InlineQueryResultCachedPhoto(
+        id=code,
+        photo_file_id=photo,
+        title=item_title(item) or code,
+        caption=caption,
+        reply_markup=kb,
+    )
+
+@dp.inline_handler()
+async def inline_search(query: types.InlineQuery):
+    hits = inline_hits(query.query or "")
+    offset = int(query.offset) if (query.offset or "").isdigit() else 0
+    page = hits[offset:offset + INLINE_PAGE_SIZE]
+    results = [r for r in (inline_result(code, get_item(code) or {}) for code in page) if r is not None]
+    next_offset = str(offset + INLINE_PAGE_SIZE) if offset + INLINE_PAGE_SIZE < len(hits) else ""
+
+    if BOT_MODE == "webhook":
+        return AnswerInlineQuery(query.id, results, cache_time=INLINE_CACHE_TIME, next_offset=next_offset)
+    await query.answer(results, cache_time=INLINE_CACHE_TIME, next_offset=next_offset)
+
+# ================== MARSHRUTLASH (ro‘yxatga olish) ==================
+# Aniq handlerlardan (bekor qilish, /start, FSM qadamlari) keyin, umumiy matn handlerlaridan oldin
+router.setup(dp)
+
+# ================== NOM BO‘YICHA QIDIRUV ==================
+# Menyu tugmalari va kodlar yuqoridagi handlerlarda ushlanadi; qolgan matn nom sifatida qidiriladi.
+@dp.message_handler(lambda m: m.text and not m.text.startswith("/") and len(normalize_words(m.text)) > 0)
+async def search_by_title(message: types.Message):
+    kb = admin_menu() if is_admin(message.from_user.id) else user_menu()
+
+    if not await check_subscription(message.from_user.id):
+        await message.answer("❗ Avval kanalga obuna bo‘ling", reply_markup=subscribe_kb())
+        return
+
+    results = search_titles(message.text)
+    if not results:
+        await message.answer("❌ Hech narsa topilmadi.\n🔎 Kino kodini yoki nomini yuboring", reply_markup=kb)
+        return
+
+    await message.answer(f"🔎 Topildi: {len(results)} ta", reply_markup=search_results_kb(results))
 
 # ================== FALLBACK (hech qachon jim emas) ==================
 @dp.message_handler(content_types=types.ContentType.ANY, state="*")
@@ -1135,12 +3507,84 @@ async def fallback_all(message: types.Message):
         await message.answer("❌ Noto'g'ri buyruq tog'o.\n👇 Menudan foydalaning.", reply_markup=admin_menu())
 
 # ================== STARTUP ==================
+# chat_member update'lari Telegram tomonidan faqat so‘ralganda yuboriladi
+ALLOWED_UPDATES = ["message", "callback_query", "inline_query", "chat_member"]
+
 async def on_startup(dp):
-    await bot.delete_webhook(drop_pending_updates=True)
+    await run_io(load_db)  # katalog + video indeks
+    await rebuild_search_index()
+    await run_io(_stats_engine)
+    await run_io(_members_store)
+    await run_io(_analytics_engine)
+    asyncio.get_event_loop().create_task(periodic_flush())
+    asyncio.get_event_loop().create_task(watch_catalog())
+    await resume_broadcast()
+    await start_metrics_server()
+    if BOT_MODE == "webhook":
+        await bot.set_webhook(
+            WEBHOOK_URL + WEBHOOK_PATH,
+            allowed_updates=ALLOWED_UPDATES,
+            drop_pending_updates=True,
+            secret_token=WEBHOOK_SECRET or None,
+        )
+    else:
+        await bot.delete_webhook(drop_pending_updates=True)
+
+class SecretWebhookHandler(WebhookRequestHandler):
+    # Telegram set_webhook(secret_token=...) dagi tokenni har so‘rovda yuboradi
+    async def post(self):
+        if WEBHOOK_SECRET:
+            got = self.request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+            if not hmac.compare_digest(got, WEBHOOK_SECRET):
+                return web.Response(status=401)
+        return await super().post()
+
+    async def process_update(self, update):
+        if not update_pool.enabled:
+            return await super().process_update(update)
+        # navbat to‘lsa shu yerda kutiladi — Telegram keyingi so‘rovlarni sekinlashtiradi
+        fut = await update_pool.submit(self.get_dispatcher(), update, want_result=True)
+        done, _ = await asyncio.wait({fut}, timeout=RESPONSE_TIMEOUT)
+        if done:
+            return fut.result()
+        fut.add_done_callback(self.respond_via_request)
+
+def webhook_executor() -> executor.Executor:
+    ex = executor.Executor(dp, skip_updates=True)
+    ex.on_startup(on_startup)
+    ex.on_shutdown(on_shutdown)
+    ex.set_webhook(WEBHOOK_PATH, request_handler=SecretWebhookHandler)
+    return ex
+
+async def on_shutdown(dp):
+    await update_pool.drain(10)     # navbatdagi update'lar tugatiladi
+    await compact_catalog()
+    async with _io_lock:
+        flush_stats()
+        flush_members()
+        flush_analytics()
+        if _broadcast is not None:
+            _atomic_write_json(BROADCAST_FILE, _broadcast)     # keyingi ishga tushishda davom etadi
 
 if __name__ == "__main__":
+    # python bot.py migrate-sqlite [movies.json] [movies.db] [movies.journal.jsonl]
+    if len(sys.argv) > 1 and sys.argv[1] == "migrate-sqlite":
+        src = sys.argv[2] if len(sys.argv) > 2 else MOVIES_FILE
+        dst = sys.argv[3] if len(sys.argv) > 3 else MOVIES_DB_FILE
+        # jurnal ko‘rsatilmasa: standart movies.json uchun MOVIES_JOURNAL, boshqa fayl uchun jurnalsiz
+        journal = sys.argv[4] if len(sys.argv) > 4 else (MOVIES_JOURNAL if src == MOVIES_FILE else "")
+        n = migrate_json_to_sqlite(src, dst, journal)
+        print(f"{n} ta item ko‘chirildi: {src} -> {dst}")
+        sys.exit(0)
+
+    if BOT_MODE == "webhook":
+        webhook_executor().run_app(host=WEBAPP_HOST, port=WEBAPP_PORT)
+        sys.exit(0)
+
     executor.start_polling(
         dp,
         skip_updates=True,
-        on_startup=on_startup
+        allowed_updates=ALLOWED_UPDATES,
+        on_startup=on_startup,
+        on_shutdown=on_shutdown
     )